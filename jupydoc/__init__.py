@@ -1,10 +1,30 @@
-"""jupydoc package 
+"""jupydoc package
+
+The classes are imported when first used, so that importing the package, e.g. for the
+command line client, does not import matplotlib and the rest.
 """
 
 #from setuptools import setup, find_packages
 
-from .publisher import Publisher, nbdoc
-from .docpub import DocPublisher
-from .docman import DocMan
-from .docpub import Index as DocIndex 
+# name: (module, attribute)
+_exports = dict(
+    Publisher   = ('.publisher', 'Publisher'),
+    nbdoc       = ('.publisher', 'nbdoc'),
+    DocPublisher= ('.docpub', 'DocPublisher'),
+    DocMan      = ('.docman', 'DocMan'),
+    DocIndex    = ('.docpub', 'Index'),
+    )
+
+__all__ = list(_exports)
+
+def __getattr__(name):
+    if name not in _exports:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    import importlib
+    module, attr = _exports[name]
+    value = getattr(importlib.import_module(module, __name__), attr)
+    globals()[name] = value
+    return value
 
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,249 @@
+"""Command line interface for jupydoc
+
+    python -m jupydoc build <package> [-j N] [--changed] [--daemon] [documents ...]
+    python -m jupydoc watch <package> [-j N] [--delay SECONDS] [--poll]
+    python -m jupydoc serve <package> [--port PORT] [--delay SECONDS] [--poll]
+    python -m jupydoc daemon <package> [--stop]
+
+builds the documents found by DocMan in the package, then updates the index of each docs folder once.
+With --changed, only documents whose inputs or outputs differ from their build manifest are built.
+The exit status is 1 if any document failed.
+
+watch builds the stale documents, then, on each change to a source file, builds the documents that depend
+on it. If only section functions of a document's module changed, the sections whose code did not change are
+replayed from the section cache.
+
+serve does the same as watch, building in this process, and serves the docs folder: open pages show the
+output of each section as soon as it is finished, and are reloaded when the document is saved.
+
+daemon keeps a warm interpreter, see jupydoc.daemon, to run the builds requested by build --daemon.
+"""
+import os, sys, time, argparse, traceback
+
+# set before matplotlib is imported: no windows
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+_docman = None # in each worker process
+
+def _init_worker(package, docspath):
+    global _docman
+    from .docman import DocMan
+    _docman = DocMan(package, docspath=docspath)
+
+def build_one(docname:'document class name, perhaps with a version',
+              kwargs:'for the document call'={},
+             )->'(docname, ok, docspath, index entry, elapsed time)':
+    from .indexer import DocIndexer
+    t = time.time()
+    try:
+        doc = _docman(docname, no_display=True)
+        if doc is None:
+            return docname, False, None, None, time.time()-t
+        doc(update_index=False, **kwargs)
+        ok = getattr(doc, 'build_ok', False)
+        entry = DocIndexer.entry(doc) if ok and doc.docpath else None
+        return docname, ok, doc.docpath, entry, time.time()-t
+    except Exception as e:
+        print(f'Document {docname} failed: {e.__class__.__name__}: {e}', file=sys.stderr)
+        traceback.print_exc()
+        return docname, False, None, None, time.time()-t
+
+def build(package:'name of the package with the documents',
+          docnames:'documents to build; all if empty'=[],
+          jobs:'number of processes'=1,
+          docspath:'output folder, if not set by the package'='',
+          changed:'build only the documents that are stale according to their manifest'=False,
+          docman:'a DocMan for the package and docspath, to use rather than making one'=None,
+          **kwargs:'for each document call, like use_cache',
+         )->'True if all succeeded':
+    from .indexer import DocIndexer
+    from .docpub import run_index
+    import concurrent.futures
+    global _docman
+
+    from .store import ContentStore, cache_path
+    ContentStore.auto_gc = False # run once, below, rather than at each save in each process
+
+    if docman is None:
+        _init_worker(package, docspath)
+    else:
+        _docman = docman
+    docnames = list(dict.fromkeys(docnames)) or [name for name in _docman.doc_classes if name!='Index']
+    if not docnames:
+        print(f'No documents found in {package}', file=sys.stderr)
+        return False
+    if changed:
+        from .manifest import stale_reason
+        stale = []
+        for name in docnames:
+            reason = stale_reason(_docman, name)
+            if reason:
+                print(f'{name}: {reason}')
+                stale.append(name)
+        if not stale:
+            print(f'All {len(docnames)} documents are up to date')
+            return True
+        docnames = stale
+    print(f'Building {len(docnames)} documents from {package} with {jobs} process{"es" if jobs>1 else ""}')
+
+    if jobs<=1:
+        results = [build_one(name, kwargs) for name in docnames]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(jobs,
+                initializer=_init_worker, initargs=(package, docspath)) as pool:
+            futures = [pool.submit(build_one, name, kwargs) for name in docnames]
+            results = []
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e: # the process died
+                    print(f'Build process failed: {e.__class__.__name__}: {e}', file=sys.stderr)
+                    results.append((docnames[futures.index(future)], False, None, None, 0))
+
+    # a single update of the index in each docs folder
+    entries = {}
+    for docname, ok, path, entry, _ in results:
+        if entry: entries.setdefault(path, {})[docname] = entry
+    for path, new in entries.items():
+        indexer = DocIndexer(docspath=path)
+        indexer.update(new)
+        indexer.save()
+        run_index(_docman, path, no_display=True)
+    # once, rather than at each save
+    for path in set(r[2] for r in results if r[2]):
+        ContentStore(cache_path('store', path)).gc()
+
+    failed = [r[0] for r in results if not r[1]]
+    for docname, ok, _, _, dt in sorted(results, key=lambda r: r[0]):
+        print(f'{docname:30} {"ok" if ok else "FAILED":6} {dt:6.1f} s')
+    if failed:
+        print(f'{len(failed)} of {len(results)} documents failed: {", ".join(sorted(failed))}', file=sys.stderr)
+    return not failed
+
+def watch(package:'name of the package with the documents',
+          jobs:'number of processes'=1,
+          docspath:'output folder, if not set by the package'='',
+          delay:'seconds without a change before building'=0.3,
+          polling:'poll even if inotify is available'=False,
+         ):
+    from . import docman as docman_module
+    from .watcher import make_watcher, debounced, affected_documents, document_inputs, invalidate, module_hashes
+
+    # the cache may be as stale as the documents
+    build(package, [], jobs, docspath, changed=True, use_cache='refresh')
+    if not _docman.doc_classes:
+        return False # nothing to watch: already reported
+
+    parsed = {} # the imports of each file, parsed again only when it changes
+    hashes = module_hashes(_docman) # to tell if only section functions change
+    def inputs():
+        return set().union(*(document_inputs(_docman, name, parsed) for name in _docman.doc_classes if name!='Index'))
+    path = docman_module.packagepath
+    watcher = make_watcher([path] if path else [], inputs(), polling)
+    print(f'Watching {path or package} with {watcher.__class__.__name__}: Ctrl-C to stop')
+    try:
+        for changed in debounced(watcher, delay):
+            _init_worker(package, docspath) # to find new documents
+            for fn in changed: parsed.pop(os.path.abspath(fn), None)
+            own, other = affected_documents(_docman, changed, parsed, hashes)
+            if not own and not other:
+                continue
+            print(f'Changed: {", ".join(sorted(os.path.relpath(fn) for fn in changed))}')
+            # also for -j: the workers are forked from this process
+            invalidate(_docman, changed, own+other)
+            # replay the unchanged sections only if the changes are all in section functions
+            if own: build(package, own, jobs, docspath, use_cache=True)
+            if other: build(package, other, jobs, docspath, use_cache='refresh')
+            watcher.watch_files(inputs())
+    except KeyboardInterrupt:
+        pass
+    return True
+
+def serve(package:'name of the package with the documents',
+          docspath:'output folder, if not set by the package'='',
+          port:'port number'=8000,
+          host:'address to bind'='127.0.0.1',
+          delay:'seconds without a change before building'=0.3,
+          polling:'poll even if inotify is available'=False,
+         ):
+    from .docpub import build_listeners
+    from .server import start_server
+
+    _init_worker(package, docspath)
+    path = _docman.docspath
+    if not path:
+        print(f'No docs folder to serve for {package}', file=sys.stderr)
+        return False
+    path = os.path.expandvars(path)
+    os.makedirs(path, exist_ok=True)
+    server, broadcaster = start_server(path, port, host)
+    build_listeners.append(broadcaster.listener)
+    print(f'Serving {path} at http://{host}:{server.server_address[1]}/')
+    try:
+        return watch(package, 1, docspath, delay, polling)
+    finally:
+        build_listeners.remove(broadcaster.listener)
+        server.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m jupydoc', description='jupydoc document tools')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    p = commands.add_parser('build', help='build the documents in a package')
+    p.add_argument('package', help='package, or module, with the document classes')
+    p.add_argument('documents', nargs='*', help='documents to build; default all')
+    p.add_argument('-j', '--jobs', type=int, default=1, help='number of processes')
+    p.add_argument('--docspath', default='', help='output folder, if not set by the package')
+    p.add_argument('--use-cache', action='store_true', help='replay unchanged sections')
+    p.add_argument('--changed', action='store_true', help='build only documents with changed inputs')
+    p.add_argument('--daemon', action='store_true', help='send the request to the daemon, if running')
+
+    p = commands.add_parser('watch', help='rebuild the documents affected by each source change')
+    p.add_argument('package', help='package, or module, with the document classes')
+    p.add_argument('-j', '--jobs', type=int, default=1, help='number of processes')
+    p.add_argument('--docspath', default='', help='output folder, if not set by the package')
+    p.add_argument('--delay', type=float, default=0.3, help='seconds to wait for more changes')
+    p.add_argument('--poll', action='store_true', help='poll for changes, even if inotify is available')
+
+    p = commands.add_parser('serve', help='serve the docs folder, and rebuild as with watch, showing progress')
+    p.add_argument('package', help='package, or module, with the document classes')
+    p.add_argument('--docspath', default='', help='output folder, if not set by the package')
+    p.add_argument('--port', type=int, default=8000, help='port number')
+    p.add_argument('--host', default='127.0.0.1', help='address to bind')
+    p.add_argument('--delay', type=float, default=0.3, help='seconds to wait for more changes')
+    p.add_argument('--poll', action='store_true', help='poll for changes, even if inotify is available')
+
+    p = commands.add_parser('daemon', help='keep a warm interpreter to run build --daemon requests')
+    p.add_argument('package', help='package, or module, with the document classes')
+    p.add_argument('--docspath', default='', help='output folder, if not set by the package')
+    p.add_argument('--socket', default=None, help='socket file, if not the default for the package')
+    p.add_argument('--stop', action='store_true', help='stop the running daemon')
+
+    args = parser.parse_args(argv)
+    if args.command=='build':
+        if args.daemon:
+            from .daemon import request
+            status = request(args.package, args=dict(docnames=args.documents, jobs=args.jobs, 
+                            docspath=args.docspath, changed=args.changed, use_cache=args.use_cache))
+            if status is not None:
+                return status
+            print(f'No daemon for {args.package}: building here', file=sys.stderr)
+        ok = build(args.package, args.documents, args.jobs, args.docspath,
+                   changed=args.changed, use_cache=args.use_cache)
+        return 0 if ok else 1
+    if args.command=='watch':
+        return 0 if watch(args.package, args.jobs, args.docspath, args.delay, args.poll) else 1
+    if args.command=='serve':
+        return 0 if serve(args.package, args.docspath, args.port, args.host, args.delay, args.poll) else 1
+    if args.command=='daemon':
+        from .daemon import run_daemon, request
+        if args.stop:
+            status = request(args.package, 'stop', path=args.socket)
+            if status is None:
+                print(f'No daemon for {args.package}', file=sys.stderr)
+                return 1
+            return status
+        return 0 if run_daemon(args.package, args.docspath, args.socket) else 1
+
+if __name__=='__main__':
+    sys.exit(main())
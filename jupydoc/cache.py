@@ -0,0 +1,177 @@
+"""
+Disk cache of section output for DocPublisher
+
+A section function's output, the markdown cells it added to the document and the
+figure or image files it wrote, is saved under a key made from everything that
+could change it. An unchanged section is then replayed rather than executed.
+"""
+import os, sys, json, hashlib, shutil, pickle
+from .store import copy_if_changed
+
+
+class SectionCache(object):
+    """Manage a folder of cached section records, one per section function
+
+    Each record is a json file with entries
+        key:   the hash that must match for the record to be valid
+        cells: list of (mimetype, text) pairs, the section's output cells
+        files: list of paths, relative to the document folder, of figure or image files
+        nfigs: number of figure numbers used by the section
+        fig_start: the figure number before the section, to which the figure numbers are relative
+        code_key: the key, but with the function's docstring excluded
+    Copies of the files are kept in a "files/<name>" subfolder, and snapshots of the
+    symbols used to format the cells made by publishme are pickled to "<name>.pkl".
+    """
+
+    def __init__(self, folder:'folder to hold the records'):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def key(*items:'objects with reproducible repr') -> str:
+        return hashlib.sha1(repr(items).encode('utf8')).hexdigest()
+
+    def clear(self):
+        # remove all the records
+        shutil.rmtree(self.folder, ignore_errors=True)
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _filename(self, name):
+        return os.path.join(self.folder, name+'.json')
+
+    def _file_folder(self, name):
+        return os.path.join(self.folder, 'files', name)
+
+    def get(self,
+            name:'section function name, with args if any',
+            key:'required key; if None, return the record in any case'=None,
+           )->'dict or None':
+        filename = self._filename(name)
+        if not os.path.isfile(filename): return None
+        try:
+            with open(filename, 'r') as inp:
+                record = json.load(inp)
+        except Exception as e:
+            print(f'SectionCache: failed to read {filename}: {e}', file=sys.stderr)
+            return None
+        if key is not None and record.get('key')!=key:
+            return None
+        # all the files must still be there
+        file_folder = self._file_folder(name)
+        for fn in record['files']:
+            if not os.path.isfile(os.path.join(file_folder, fn)):
+                return None
+        return record
+
+    def put(self,
+            name:'section function name, with args if any',
+            key:'the key for the record',
+            cells:'list of (mimetype, text) pairs',
+            files:'list of file names relative to the source folder'=[],
+            nfigs:'number of figures'=0,
+            fig_start:'figure number before the section'=0,
+            source_folder:'where to find the files'='.',
+            code_key:'key excluding the docstring'=None,
+            snapshots:'dict, cell index: snapshot, for re-rendering'=None,
+           ):
+        file_folder = self._file_folder(name)
+        if os.path.isdir(file_folder):
+            shutil.rmtree(file_folder)
+        saved = []
+        for fn in files:
+            src = os.path.join(source_folder, fn)
+            if not os.path.isfile(src):
+                print(f'SectionCache: file {src} not found', file=sys.stderr)
+                return
+            dest = os.path.join(file_folder, fn)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copyfile(src, dest)
+            saved.append(fn)
+        record = dict(key=key, cells=[list(c) for c in cells], files=saved, nfigs=nfigs, fig_start=fig_start,
+                      code_key=code_key)
+        pkl = os.path.join(self.folder, name+'.pkl')
+        if snapshots:
+            with open(pkl, 'wb') as out:
+                pickle.dump(snapshots, out)
+        elif os.path.isfile(pkl):
+            os.remove(pkl)
+        with open(self._filename(name), 'w') as out:
+            json.dump(record, out)
+
+    def get_snapshots(self, name)->'dict, cell index: snapshot, or None':
+        pkl = os.path.join(self.folder, name+'.pkl')
+        if not os.path.isfile(pkl): return None
+        try:
+            with open(pkl, 'rb') as inp:
+                return pickle.load(inp)
+        except Exception as e:
+            print(f'SectionCache: failed to load {pkl}: {e}', file=sys.stderr)
+            return None
+
+    def restore_files(self,
+            name:'section function name',
+            record:'a record returned by get',
+            folders:'list of document folders',
+            store:'optional ContentStore'=None,
+            rename:'dict, saved name: name to restore it as'={},
+            ):
+        # copy the saved files back to each document folder, if changed
+        file_folder = self._file_folder(name)
+        for folder in folders:
+            for fn in record['files']:
+                src, dest = os.path.join(file_folder, fn), os.path.join(folder, rename.get(fn, fn))
+                if store: store.install_file(src, dest)
+                else: copy_if_changed(src, dest)
+
+
+def code_hash(function)->'hash of the source of function, excluding its docstring, or None':
+    import ast, inspect, textwrap
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(function)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    body = tree.body[0].body
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        del body[0]
+    return hashlib.sha1(ast.dump(tree).encode('utf8')).hexdigest()
+
+def snapshot(doc:'the processed docstring', 
+             vars:'symbol table after object replacement and formatting', 
+             replacer:'the ObjectReplacer', 
+             max_size:'largest pickle to keep'=10_000_000,
+            )->'dict with "vars" and "attrs" dicts':
+    """Save what is needed to format a modified docstring without running the function:
+    pickled values of the symbols, or the HTML of replaced objects that were rendered, and 
+    pickled values of the document attributes referenced by the docstring. Values that cannot be 
+    pickled, are too big, or would need replacing are left out.
+    """
+    from .replacer import Wrapper
+    from .helpers import field_names, field_root
+    fields = field_names(doc)
+    roots = set(field_root(f) for f in fields)
+
+    def pickled(value):
+        try:
+            data = pickle.dumps(value)
+        except Exception:
+            return None
+        return data if len(data)<=max_size else None
+
+    snap = dict(vars={}, attrs={})
+    for name, value in vars.items():
+        if name=='self': continue
+        if isinstance(value, Wrapper):
+            if hasattr(value, '_html') or name in roots:
+                snap['vars'][name] = ('html', str(value))
+            continue
+        if replacer.wrapper_for(value): continue
+        data = pickled(value)
+        if data is not None: snap['vars'][name] = ('pickle', data)
+    doc_obj = vars.get('self', None)
+    for field in fields:
+        t = field.split('[')[0].split('.')
+        if t[0]!='self' or len(t)<2 or t[1] not in getattr(doc_obj, '__dict__', {}): continue
+        data = pickled(getattr(doc_obj, t[1]))
+        if data is not None: snap['attrs'][t[1]] = data
+    return snap
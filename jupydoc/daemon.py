@@ -0,0 +1,162 @@
+"""
+Build daemon: a warm interpreter that builds documents on request
+
+The daemon imports jupydoc, and matplotlib, pandas, and the rest, once, makes a DocMan for the package,
+then listens on a Unix socket. For each build request it forks a worker, which starts with all of
+that ready, imports the document modules from their current files, and sends its output, then its exit
+status, back to the client. The parent never imports a document module, so each worker sees the
+current source.
+
+A request is a line of json, with "command", "build" or "stop", and for a build, "args" for the build
+function and "cwd". The reply is the output, then a zero byte and the exit status.
+"""
+import os, sys, json, socket, signal, traceback
+
+# imported by the daemon, if available, so that the workers do not
+preload = ['yaml', 'numpy', 'pandas', 'matplotlib.pyplot', 'nbconvert']
+
+def socket_path(package:'name of the package')->'default socket file for its daemon':
+    from .docman import cache_folder
+    return os.path.join(cache_folder(), f'daemon-{package}.sock')
+
+def connect(path)->'a connected socket, or None if no daemon is listening':
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return s
+    except (FileNotFoundError, ConnectionRefusedError):
+        s.close()
+        return None
+
+def request(package:'name of the package',
+            command:'"build" or "stop"'='build',
+            args:'for the build function'={},
+            path:'socket file, if not the default'=None,
+            out=None,
+           )->'exit status, or None if there is no daemon':
+    s = connect(path or socket_path(package))
+    if s is None: return None
+    out = out or sys.stdout.buffer
+    with s:
+        s.sendall((json.dumps(dict(command=command, args=args, cwd=os.getcwd()))+'\n').encode('utf8'))
+        tail = b''
+        while True:
+            data = s.recv(65536)
+            if not data: break
+            if tail or b'\0' in data:
+                tail += data
+                continue
+            out.write(data)
+            out.flush()
+        text, _, status = tail.rpartition(b'\0')
+        out.write(text)
+        out.flush()
+    try:
+        return int(status)
+    except ValueError:
+        print('jupydoc daemon: no status returned: the worker died?', file=sys.stderr)
+        return 1
+
+def package_signature(docman)->'dict, file: (mtime_ns, size), of the source files that discovery reads':
+    from . import docman as docman_module
+    from .watcher import source_files
+    from .manifest import module_file
+    path = docman_module.packagepath
+    extra = set(filter(None, (module_file(name) for name in set(docman.lookup_module.values()))))
+    return source_files([path] if path else [], extra)
+
+def _worker(conn, request, package, docspath, signature):
+    # in the forked process: send the output of the build to the client
+    from . import __main__ as cli
+    status = 1
+    args = dict(request.get('args', {}))
+    args['docspath'] = args.get('docspath') or docspath
+    # the DocMan made by the daemon, unless the request is for another docs folder, or a source file
+    # has changed since, so that documents may have been added or moved
+    docman = cli._docman if args['docspath']==docspath and package_signature(cli._docman)==signature else None
+    try:
+        sys.stdout.flush(); sys.stderr.flush()
+        os.dup2(conn.fileno(), 1)
+        os.dup2(conn.fileno(), 2)
+        sys.stdout.reconfigure(line_buffering=True)
+        os.chdir(request.get('cwd') or os.getcwd())
+        status = 0 if cli.build(package, docman=docman, **args) else 1
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush(); sys.stderr.flush()
+            conn.sendall(b'\0'+str(status).encode())
+        finally:
+            os._exit(status)
+
+def run_daemon(package:'name of the package with the documents',
+               docspath:'output folder, if not set by the package'='',
+               path:'socket file, if not the default'=None,
+              )->'True if it ran, and was stopped':
+    import importlib
+    from . import __main__ as cli
+    from . import docpub, indexer, manifest # noqa: loaded to be inherited
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass # optional
+
+    cli._init_worker(package, docspath)
+    if not cli._docman.doc_classes:
+        print(f'No documents found in {package}', file=sys.stderr)
+        return False
+    signature = package_signature(cli._docman)
+    path = path or socket_path(package)
+    existing = connect(path)
+    if existing is not None:
+        existing.close()
+        print(f'A daemon is already listening on {path}', file=sys.stderr)
+        return False
+    if os.path.exists(path): os.remove(path) # left by one that did not stop
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(8)
+    server.settimeout(1) # to reap the workers
+    signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+    print(f'jupydoc daemon for {package} listening on {path}', flush=True)
+    children = set()
+    try:
+        while True:
+            for pid in list(children):
+                if os.waitpid(pid, os.WNOHANG)[0]: children.discard(pid)
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                continue
+            with conn:
+                conn.setblocking(True)
+                try:
+                    req = json.loads(conn.makefile('rb').readline())
+                except ValueError as e:
+                    conn.sendall(f'Invalid request: {e}\n'.encode()+b'\x002')
+                    continue
+                command = req.get('command')
+                if command=='stop':
+                    conn.sendall(b'daemon stopped\n\x000')
+                    break
+                if command!='build':
+                    conn.sendall(f'Unknown command: {command}\n'.encode()+b'\x002')
+                    continue
+                pid = os.fork()
+                if pid==0:
+                    server.close()
+                    _worker(conn, req, package, docspath, signature)
+                children.add(pid)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        if os.path.exists(path): os.remove(path)
+        for pid in children:
+            os.waitpid(pid, 0)
+    return True
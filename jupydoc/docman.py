@@ -1,15 +1,105 @@
 """Document management for jupydoc 
 
 """
-import os, sys, glob
-import importlib 
+import os, sys, json
+import importlib, importlib.util
 
 # from .indexer import DocIndex
 
 # local globals    
 verbose = False
 packagepath= rootpath= ''
-packages = modules = None
+packages = modules = static_info = None
+
+# the module-level names that discovery looks for
+discovery_names = ('__docs__', 'docspath', 'Index')
+
+def cache_folder():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'jupydoc')
+
+class StaticInfo(object):
+    """Find the values of module-level names by parsing a source file, rather than importing it.
+    A name that is assigned a literal value, like a list of strings, is found; if it is imported, or 
+    assigned anything else, it is "dynamic", and the module must be imported to find it.
+    Results are saved in a json file, and reused while a file's mtime and size are unchanged.
+    """
+    def __init__(self, filename:'the cache file; None for the default'=None):
+        self.filename = filename or os.path.join(cache_folder(), 'discovery.json')
+        self.entries = {} # key: source file; value: [mtime_ns, size, values dict, dynamic names]
+        self.changed = False
+        if os.path.isfile(self.filename):
+            try:
+                with open(self.filename, 'r') as inp:
+                    self.entries = json.load(inp)
+            except Exception as e:
+                print(f'StaticInfo: ignoring {self.filename}: {e}', file=sys.stderr)
+
+    def __call__(self, filename)->'(dict of values, list of dynamic names)':
+        filename = os.path.abspath(filename)
+        st = os.stat(filename)
+        entry = self.entries.get(filename)
+        if entry and entry[:2]==[st.st_mtime_ns, st.st_size]:
+            return entry[2], entry[3]
+        values, dynamic = parse_names(filename, discovery_names)
+        self.entries[filename] = [st.st_mtime_ns, st.st_size, values, dynamic]
+        self.changed = True
+        return values, dynamic
+
+    def save(self):
+        if not self.changed: return
+        try:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            tmp = self.filename+f'.{os.getpid()}'
+            with open(tmp, 'w') as out:
+                json.dump(self.entries, out)
+            os.replace(tmp, self.filename)
+            self.changed = False
+        except Exception as e:
+            print(f'StaticInfo: could not save {self.filename}: {e}', file=sys.stderr)
+
+def parse_names(filename, names)->'(dict of values, list of dynamic names)':
+    # find literal assignments of names, at module level
+    import ast
+    with open(filename, 'rb') as inp:
+        source = inp.read()
+    present = [name for name in names if name.encode() in source]
+    if not present: return {}, []
+    try:
+        tree = ast.parse(source, filename)
+    except (SyntaxError, ValueError):
+        return {}, present # the import will report it 
+
+    values, dynamic = {}, set()
+    def visit(body, nested):
+        for node in body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                continue
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                for alias in node.names:
+                    name = alias.asname or alias.name
+                    if name in names: dynamic.add(name)
+                continue
+            if isinstance(node, ast.Assign) and not nested:
+                targets = [t.id for t in node.targets if isinstance(t, ast.Name) and t.id in names]
+                for name in targets:
+                    try:
+                        value = ast.literal_eval(node.value)
+                        json.dumps(value)
+                        values[name] = value
+                        dynamic.discard(name)
+                    except Exception:
+                        dynamic.add(name)
+                if targets or not any(isinstance(t, (ast.Tuple, ast.List)) for t in node.targets):
+                    continue
+            # any other binding of the names, perhaps conditional, needs the import
+            for child in ast.walk(node):
+                if isinstance(child, ast.Name) and isinstance(child.ctx, ast.Store) and child.id in names:
+                    dynamic.add(child.id)
+            for field in ('body', 'orelse', 'finalbody', 'handlers'):
+                visit(getattr(node, field, []), True)
+    visit(tree.body, False)
+    for name in dynamic: values.pop(name, None)
+    return values, sorted(dynamic)
 
 class Modules(dict):
     # manage list of modules, python files 
@@ -27,13 +117,16 @@ class Modules(dict):
         ll = len(rootpath)+1
         # make package name from file path
         p = path[ll:].replace('/', '.')
-        mdl = import_module(name, package=p)
-        if not mdl:  return 
-        
-        # ok, now check for __docs__ in the compiled module
-        docs = getattr(mdl, '__docs__', [])
+        values, dynamic = static_info(os.path.join(path, m))
+        if '__docs__' in dynamic:
+            # must import it to find out
+            mdl = import_module(name, package=p)
+            if not mdl:  return 
+            module_name, docs = mdl.__name__, getattr(mdl, '__docs__', [])
+        else:
+            module_name, docs = p+'.'+name, values.get('__docs__', [])
         if docs:
-            self[mdl.__name__] = docs            
+            self[module_name] = docs            
             return True
         
     def __str__(self):
@@ -64,24 +157,25 @@ class Packages(dict):
         if not p: 
             return True # first time
 
-        if verbose: print(f'create new package {p}.{m} ?')
-        pk = import_module(m, package=p)
-        if not pk: return
-        self.add_entry(pk)
+        name = path[rploc+1:].replace('/', '.')
+        if verbose: print(f'create new package {name} ?')
+        attrs = package_attributes(name, path)
+        if attrs is None: return
+        self.add_entry(name, attrs)
         return ok 
 
-    def add_entry(self, package):
-        if not package: return
-        docspath = getattr(package, 'docspath', '')
-        index = getattr(package, 'Index', '')
+    def add_entry(self, name:'package name', attrs:'dict with docspath and Index, if set'):
+        if attrs is None: return
+        docspath = attrs.get('docspath', '')
+        index = attrs.get('Index', '')
         if index:
-            if verbose: print(f'Package {package} has an Index')
-            self.indexdoc = package.Index
+            if verbose: print(f'Package {name} has an Index')
+            self.indexdoc = index
         if not docspath: return
         if docspath[0]!='/':
             docspath = os.path.abspath(os.path.join(packagepath, docspath))
         if verbose: print(f'Added docspath {docspath}')
-        self[package.__name__] = docspath
+        self[name] = docspath
         return True 
 
     def __str__(self):
@@ -90,6 +184,23 @@ class Packages(dict):
             r +=f'\n   {p}'
         return r
     def __repr__(self): return str(self)
+
+def package_attributes(name, path)->'dict, or None if it failed to import':
+    # the docspath and Index of a package, from its __init__.py, importing it only if necessary
+    filename = os.path.join(path, '__init__.py')
+    values, dynamic = static_info(filename)
+    if not ('docspath' in dynamic or 'Index' in dynamic):
+        # not imported: but a package that would fail to compile is still skipped, as if imported
+        try:
+            with open(filename, 'rb') as inp:
+                compile(inp.read(), filename, 'exec')
+        except (SyntaxError, ValueError) as e:
+            print(f'Failed to import package "{name}": {e}', file=sys.stderr)
+            return None
+        return values
+    pk = import_module(name)
+    if not pk: return None
+    return dict(docspath=getattr(pk, 'docspath', ''), Index=getattr(pk, 'Index', ''))
     
 def traceback_message(e, limit=None, skip=0, ):
     import traceback
@@ -98,19 +209,84 @@ def traceback_message(e, limit=None, skip=0, ):
     #for i in range(skip): tb = tb.tb_next
     #traceback.print_tb(tb, limit)
     
+# for each module loaded by import_module, its files, with (mtime_ns, size, sha1) when loaded
+loaded = {}
+
+def file_signature(filename):
+    import hashlib
+    st = os.stat(filename)
+    with open(filename, 'rb') as inp:
+        return st.st_mtime_ns, st.st_size, hashlib.sha1(inp.read()).hexdigest()
+
+def dependencies(module)->'(module names, file names) from the optional list __depends__ of the module':
+    # an entry is a file, relative to the module's folder, or a module name, perhaps relative to its package
+    folder = os.path.dirname(getattr(module, '__file__', None) or '')
+    mods, files = [], []
+    for dep in getattr(module, '__depends__', []):
+        filename = os.path.join(folder, os.path.expandvars(dep))
+        if os.path.isfile(filename):
+            files.append(filename)
+        else:
+            mods.append(importlib.util.resolve_name(dep, module.__package__) if dep.startswith('.') else dep)
+    return mods, files
+
+def record_load(name, module):
+    mods, dep_files = dependencies(module)
+    for m in mods:
+        if m not in sys.modules: import_module(m) # to have its file to check
+    files = [module.__file__] if getattr(module, '__file__', None) else [] 
+    files += dep_files
+    files += [sys.modules[m].__file__ for m in mods if getattr(sys.modules.get(m), '__file__', None)]
+    ret = {}
+    for fn in files:
+        try:
+            ret[fn] = file_signature(fn)
+        except OSError:
+            pass
+    loaded[name] = ret
+
+_checking = set() # modules being checked, in case of a dependency cycle
+
+def is_changed(name, module)->'True if the module, or a dependency, has changed since loaded':
+    if name not in loaded: return True
+    if name in _checking: return False
+    _checking.add(name)
+    try:
+        # reload any changed module dependencies first: their files are in the list
+        for dep in dependencies(module)[0]:
+            dep_module = sys.modules.get(dep)
+            if dep_module is None or is_changed(dep, dep_module):
+                import_module(dep)
+        for fn, (mtime, size, digest) in loaded[name].items():
+            try:
+                st = os.stat(fn)
+                if (st.st_mtime_ns, st.st_size)==(mtime, size): continue
+                if file_signature(fn)[2]!=digest: return True
+            except OSError:
+                return True
+            loaded[name][fn] = (st.st_mtime_ns, st.st_size, digest) # only touched
+        return False
+    finally:
+        _checking.discard(name)
+
 def import_module(name, package=None):
     # return a module object, creating if package specified, which must be the name
     # of an existing module
     if verbose: print(f'Try to import {name}, {package}')
     if not package:
-        # already a module: get it and try to reload
+        # already a module: get it and reload it if it, or a declared dependency, has changed
+        new = name not in sys.modules
         try:
             module  = importlib.import_module(name)
         except Exception as e:
             print(f'Failed to import existing module "{name}"', file=sys.stderr)
             return
+        if new or not is_changed(name, module):
+            if new: record_load(name, module)
+            return module
         try:
             importlib.reload(module)
+            record_load(name, module)
             return module
         except Exception as e:
             # compilation error, maybe
@@ -122,7 +298,9 @@ def import_module(name, package=None):
     try:
         # maybe don't need this? Doesn't seem to hurt.
         #importlib.reload(sys.modules[package]) # since already exists, reload
-        return importlib.import_module('.'+name, package=package)
+        module = importlib.import_module('.'+name, package=package)
+        record_load(module.__name__, module)
+        return module
     except Exception as e:
         print(f'Failed trying to create new module adding ".{name}" '\
               f'to existing module "{package}":\n {e}', file=sys.stderr)
@@ -130,21 +308,48 @@ def import_module(name, package=None):
         #traceback_message(e, limit=-1)
         return None
 
-def find_modules( path):
+def scan_tree(path)->'list of (folder, sorted module file names), the folder and its subpackages in order':
+    mods, dirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.find('__')>=0 or entry.name.startswith('.'): continue
+            if entry.is_dir(): 
+                dirs.append(entry.path)
+            elif entry.name.endswith('.py') and entry.is_file(): 
+                mods.append(entry.name)
+    ret = [(path, sorted(mods))]
+    for d in sorted(dirs):
+        if os.path.isfile(os.path.join(d, '__init__.py')):
+            ret += scan_tree(d)
+    return ret
+
+def find_modules( path, threads:'number of threads to parse files; None for the default'=None):
     if verbose: print(f'check package {path} for subpackages and modules:')
+    import concurrent.futures
 
-    flist = list(filter( lambda f: f.find('__')<0, glob.glob(path+'/*')))
-    dirs = [ os.path.split(f)[-1] for f in flist if os.path.isdir(f)]
-    ismod = lambda f: os.path.isfile(f) and  os.path.splitext(f)[1]=='.py'
-    mods = [ os.path.split(f)[-1] for f in flist if ismod(f)]
-    if verbose:
-        print(f'{path}:\n\t {dirs}\n\t {mods}')
-    for m in mods:
-        modules.check(path, m)
-    for d in dirs:
-        newpath = path+'/'+d
-        if packages.check(newpath):
-            find_modules(newpath)
+    folders = scan_tree(path)
+
+    # parse all the files at once, so the checks below find the results in static_info
+    def parse(filename):
+        try:
+            static_info(filename)
+        except Exception:
+            pass # it will be reported by the check
+    files = [os.path.join(folder, '__init__.py') for folder, _ in folders[1:]] \
+          + [os.path.join(folder, m) for folder, mods in folders for m in mods]
+    with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+        list(pool.map(parse, files))
+
+    # then, in order, import where necessary, skipping the subtree of a package that fails
+    failed = []
+    for folder, mods in folders:
+        if any(folder.startswith(f+os.sep) for f in failed): continue
+        if verbose: print(f'{folder}:\n\t {mods}')
+        if folder!=path and not packages.check(folder):
+            failed.append(folder)
+            continue
+        for m in mods:
+            modules.check(folder, m)
 
 class DocMan(object):
     
@@ -153,39 +358,44 @@ class DocMan(object):
                      set_verbose=False):
         
         # set globals for helper classes
-        global verbose, packagepath, rootpath, packages, modules
+        global verbose, packagepath, rootpath, packages, modules, static_info
         docman_instance = None 
         packages = Packages()
         modules = Modules()
+        static_info = StaticInfo()
         self.lookup_module={}
         
         verbose =set_verbose
         
         self.docspath = docspath
         
-        # import the root package, check it
-        rootpackage= import_module(rootname)
-        if not rootpackage:
+        # find the root package, without importing it
+        try:
+            spec = importlib.util.find_spec(rootname)
+        except (ImportError, ValueError):
+            spec = None
+        if not spec or not spec.origin:
             print(f'A package {rootname} was not found.')
             return
         
         # is it a file?
-        if not hasattr(rootpackage, '__path__'):
+        if not spec.submodule_search_locations:
             # yes: very simple
-            rootpath, _ = os.path.split(rootpackage.__file__)
+            rootpath, _ = os.path.split(spec.origin)
             # docspath = docspath or rootpath
             # self.docspath = docspath if docspath[0]=='/' \
                     # else os.path.join(rootpath, docspath)
-            self.setup_file(rootpackage)
+            self.setup_file(rootname, spec.origin)
+            static_info.save()
             return
         
-        if verbose: print(f'setting up package {rootpackage}')
-        packagepath = rootpackage.__path__[0]
+        if verbose: print(f'setting up package {rootname}')
+        packagepath = list(spec.submodule_search_locations)[0]
         rootpath, _ = os.path.split(packagepath)
         if verbose: print(f'found packagepath {packagepath}, rootpath {rootpath}')
         
         # start traversing the tree
-        packages.add_entry(rootpackage)
+        packages.add_entry(rootname, package_attributes(rootname, packagepath))
         if docspath:
             self.docspath = docspath
         if not docspath:
@@ -194,22 +404,33 @@ class DocMan(object):
                 print(f'No HTML output: set the parameter "docspath" '
                       f'in "{rootname}.__init__.py" or with an arg to DocMan.')
         find_modules(packagepath)   
+        static_info.save()
 
         # generate lookup table for class names from the result
         for md, cl in modules.items():
             for  c in cl:
                 self.lookup_module[c]=md  
                 
-    def setup_file(self, module):
-        packages[module.__name__] = self.docspath
-        docs = getattr(module, '__docs__',['(nothing?)'])
+    def setup_file(self, name, filename):
+        packages[name] = self.docspath
+        values, dynamic = static_info(filename)
+        if '__docs__' in dynamic:
+            module = import_module(name)
+            docs = getattr(module, '__docs__',['(nothing?)']) if module else []
+        else:
+            docs = values.get('__docs__', ['(nothing?)'])
         for doc in docs:
-            self.lookup_module[doc] = module.__name__
-        modules[module.__name__] = docs
+            self.lookup_module[doc] = name
+        modules[name] = docs
 
     def user_modules(self):
         return modules.user_modules()
                     
+    def document_folder(self, docname:'name | name.version')->'folder with the output of the document':
+        package_name = self.lookup_module.get(docname.split('.')[0], None)
+        docspath = packages.get(package_name, self.docspath) if package_name else self.docspath
+        return os.path.join(os.path.expandvars(docspath), docname)
+
     @property
     def doc_classes(self):
         return list(self.lookup_module.keys())
@@ -1,16 +1,24 @@
 """
 Document creation 
 """
-import os, sys
+import os, sys, re
 
 import yaml
 
-from .helpers import DocInfo
+from .helpers import DocInfo, doc_formatter
 from .publisher import Publisher
+from .cache import SectionCache, code_hash, snapshot
+from .store import cache_path
 from .indexer import DocIndexer
+from .manifest import write_manifest
 
 __docs__ = ['Index']
 
+# functions called as listener(doc, event, **info) during a build, e.g. by the preview server, with
+# events "start"; "section", with sid, function, and html, the rendered output, or None if the renderer
+# cannot render cells separately; and "done", with ok and saved
+build_listeners = []
+
 class DocPublisher(Publisher):
     """
     title: |
@@ -28,6 +36,8 @@ class DocPublisher(Publisher):
                 no_display:'set True to disable IPython display output'=False, 
                 doc_dict:'Alternative to parsing docstring'={},
                 client_mode:'Set for client mode'=False,
+                cache_folder:'folder for the section cache, used if called with use_cache; '\
+                        'default in the jupydoc cache folder, for docpath'=None,
                 **kwargs):
 
         super().__init__(**kwargs)
@@ -52,6 +62,7 @@ class DocPublisher(Publisher):
         self._no_display = no_display
         self.display_on = not no_display # user can set
         self.client_mode = client_mode
+        self.cache_folder = cache_folder
 
         # make non-doc items available as attribues and in self.info
         info = doc_dict if doc_dict and type(doc_dict) == dict else {}
@@ -109,22 +120,107 @@ class DocPublisher(Publisher):
             client_mode:'Set True in this case'=False,
             quiet:'Set to avoid printing a line per section'='False',
             raise_if_exception:'set True to raise exceptions'=False,
+            use_cache:'replay sections that have not changed since the last call; '\
+                    '"refresh" to run all and save them'=False,
+            parallel:'number of processes to run independent sections; 0 to run serially'=0,
+            selected_only:'run only the selected section, and the sections it needs; '\
+                    'use the saved output of the others. Implies use_cache'=False,
+            update_index:'update the index after saving, if made by DocMan'=True,
             ):
         """assemble and save the document if docpath is set        
+        Sets build_ok True if all sections succeeded.
         """
         import inspect
         self.clear()
+        self.build_ok = False
+        self._notify('start')
+        use_cache = use_cache or selected_only
+        cache_folder = self.cache_folder or cache_path('sections', self.docpath or '.')
+        cache = SectionCache(os.path.join(cache_folder, self.docname)) if use_cache else None
+        if use_cache=='refresh':
+            cache.clear()
         
         # the DocInfo object implements an iterator, and detects selection for display
         self.doc_info.set_selection(examine)
+        required = self._required_sections() if selected_only else None
+        if required is not None and len(required)==0:
+            print(f'No section selected by examine={examine}: running all', file=sys.stderr)
+            required = None
         # specify top-level link to parent folder
         back_index = os.path.exists(os.path.realpath(os.path.join(self.docpath,'../index.html')))
         self.doc_info.back_link =\
              '<a href="../index.html?skipDecoration">back to index</a>' if back_index\
             else '<a href="../">back</a>'
 
+        if parallel and required is None:
+            ok = self._run_parallel(parallel, cache, raise_if_exception)
+        else:
+            ok = self._run_sections(cache, raise_if_exception, required=required)
+        if ok is None:
+            self._notify('done', ok=False, saved=False)
+            return
+        self.build_ok = ok
+        saved = ok and save_ok and not getattr(self,'client_mode', False)
+
+        if saved:
+            # update the document index if instantiated by DocMan and this guy has a name and not invoked as a client
+            s = ''
+            if hasattr(self, 'docman'):
+                if self.docname != 'Index':
+                    if update_index:
+                        print(f'Updating {self.docname}')
+                        self.update_index()
+
+                    if hasattr(self.docman, 'class_obj') :
+                        s = '<details> <summary> Python source code </summary> '
+                        s+=    '<pre>'
+                        s+=     inspect.getsource(self.docman.class_obj).replace('<', '&lt;').replace('>', '&gt;')
+                        s+=     '</pre>'
+                        s+= '</details>'
+
+            self.save(quiet=self.client_mode, append=s)
+            if hasattr(self, 'docman') and self.docname!='Index' and self.docpath:
+                try:
+                    write_manifest(self)
+                except Exception as e:
+                    print(f'Could not write the build manifest: {e}', file=sys.stderr)
+        self._notify('done', ok=bool(ok), saved=bool(saved))
+
+    def _notify(self, event, **info):
+        for listener in build_listeners:
+            try:
+                listener(self, event, **info)
+            except Exception as e:
+                print(f'Build listener failed: {e.__class__.__name__}: {e}', file=sys.stderr)
+
+    def _section_done(self):
+        # tell the listeners about the section just added to the log, except in a parallel worker
+        if not build_listeners or _worker_doc is not None: return
+        from .renderers import get_renderer, CellSpool
+        sid, function, selected, start, end, _ = self._section_log[-1]
+        renderer = get_renderer(self.renderer)
+        html = None
+        if renderer.per_cell:
+            # the spool has the HTML of its cells already
+            html = self._data.html(start, end) if isinstance(self._data, CellSpool) \
+                else ''.join(renderer.cell(text) for _, text in self._cells(start, end))
+        self._notify('section', sid=sid, function=function, html=html)
+
+    def _run_sections(self, cache, raise_if_exception, only=None, required=None):
+        """Run the section functions in document order, adding their output to the document
+        Return True if all succeeded, False if any raised an exception, or None if one returned
+        a failure message. If `only` is set, run only the sections, with their subsections, named in it.
+        If `required` is set, run only the functions in it, and the title page; add the
+        last saved output of the others from the cache.
+        """
         ok = True
+        # state of the current section, needed by its subsections: [funarg, key, replayed, code key]
+        parent = [None, None, False, None]
+        # record of each section run: (sid, function, selected, first cell, last cell+1, number of figures)
+        self._section_log = []
         for sid, funarg, selected in self.doc_info:
+            if only is not None and self.doc_info.section_names[int(sid)] not in only:
+                continue
             ff = funarg.split('.')
             function = ff[0]
             hasarg = len(ff)>1
@@ -136,6 +232,55 @@ class DocPublisher(Publisher):
 
             self._current_index = [int(sid), int(sid*10%10)]
             self.display_on = selected and not self.client_mode
+            issub = self._current_index[1]>0
+            start, nfig, nfiles = len(self._data), self.object_replacer.figure_number, len(self.object_replacer.files)
+
+            if required is not None and sid>0 and funarg not in required:
+                record = cache.get(funarg)
+                if record:
+                    self._replay_section(funarg, record, cache)
+                else:
+                    self._add_cells([('text/markdown', 
+                        f'<p class="errorText">Section {funarg} was not run, and has no saved output</p>')])
+                self._section_log.append((sid, function, selected, start, len(self._data), 
+                        record['nfigs'] if record else 0))
+                self._section_done()
+                if not selected and not self.client_mode:
+                    print(f'Not displaying: {sid:5} {function} (saved output)')
+                continue
+
+            # the title page is always run, since it sets the title and date
+            key = code_key = None
+            if cache and sid>0:
+                key, code_key = self._section_key(function, ff[1:], parent[1] if issub else None, 
+                        parent[3] if issub else None)
+                record = cache.get(funarg, key) if key else None
+                how = 'from cache'
+                if not record and code_key:
+                    # perhaps only the docstring changed
+                    record = cache.get(funarg)
+                    if record and record.get('code_key')==code_key and self._rerender_section(funarg, record, cache):
+                        cache.put(funarg, key, cells=self._cells(start), files=record['files'], 
+                            nfigs=record['nfigs'], fig_start=nfig, source_folder=self.doc_folders[0],
+                            code_key=code_key, snapshots=cache.get_snapshots(funarg))
+                        how = 'docstring re-rendered'
+                    else: record = None
+                elif record:
+                    self._replay_section(funarg, record, cache)
+                if record:
+                    if not issub: parent = [funarg, key, True, code_key]
+                    self._section_log.append((sid, function, selected, start, len(self._data), record['nfigs']))
+                    self._section_done()
+                    if not selected and not self.client_mode:
+                        print(f'Not displaying: {sid:5} {function} ({how})')
+                    continue
+                if issub and parent[2]:
+                    # the subsection needs the parent section's symbols
+                    self._restore_symbols(parent[0])
+                    parent[2] = False
+            if not issub: parent = [funarg, key, False, code_key]
+            self._snapshots = {} if key else None
+
             try:
                 if hasarg:
                     arg = ff[1:]
@@ -144,7 +289,7 @@ class DocPublisher(Publisher):
                     fail = eval(f'self.{function}()')
                 if fail:
                     print(f"function '{function}' failure message: {fail}", file=sys.stderr)
-                    return
+                    return None
 
             except Exception as e:
                 import traceback
@@ -154,26 +299,220 @@ class DocPublisher(Publisher):
                 for i in range(2): tb = tb.tb_next # skip our calls
                 traceback.print_tb(tb, limit=2)
                 ok=False
+                key = None
+
+            snapshots, self._snapshots = self._snapshots, None
+            nfigs = self.object_replacer.figure_number-nfig
+            self._section_log.append((sid, function, selected, start, len(self._data), nfigs))
+            self._section_done()
+            if key:
+                cache.put(funarg, key, 
+                    cells=self._cells(start),
+                    files=self.object_replacer.files[nfiles:],
+                    nfigs=nfigs,
+                    fig_start=nfig,
+                    source_folder=self.doc_folders[0],
+                    code_key=code_key,
+                    snapshots=dict((i-start, snap) for i, snap in snapshots.items()),
+                    )
 
             if not selected and not self.client_mode:
                 print(f'Not displaying: {sid:5} {function}')
- 
-        if ok and save_ok and not getattr(self,'client_mode', False):
-            # update the document index if instantiated by DocMan and this guy has a name and not invoked as a client
-            s = ''
-            if hasattr(self, 'docman'):
-                if self.docname != 'Index':
-                    print(f'Updating {self.docname}')
-                    self.update_index()
-
-                    if hasattr(self.docman, 'class_obj') :
-                        s = '<details> <summary> Python source code </summary> '
-                        s+=    '<pre>'
-                        s+=     inspect.getsource(self.docman.class_obj).replace('<', '&lt;').replace('>', '&gt;')
-                        s+=     '</pre>'
-                        s+= '</details>'
+        return ok
+
+    def _required_sections(self):
+        # the selected section functions, with the sections they need: the parent of a 
+        # subsection, and those named in "depends" entries
+        info = self.doc_info
+        required = set()
+        for sid, funarg, selected in info:
+            if not selected: continue
+            required.add(funarg)
+            todo = [info.section_names[int(sid)]]
+            while todo:
+                name = todo.pop()
+                required.add(name)
+                todo += [s for s in info.depends.get(name, []) if s not in required]
+        return required
+
+    def _cells(self, start=0, end=None):
+        # (mimetype, text) pairs for the output cells, from start
+        return [list(obj._repr_mimebundle_().items())[0] for obj in self._data[start:end]]
+
+    def _add_cells(self, cells, offset=0):
+        # add (mimetype, text) cells to the document, adding offset to their figure numbers
+        for mimetype, text in cells:
+            md_data = doc_formatter(renumber_figures(text, offset), mimetype=mimetype)
+            self._data += (md_data,)
+            self._display(md_data)
+
+    def _run_parallel(self, nworkers, cache, raise_if_exception):
+        """Run the title page here, then each independent group of sections in a forked process.
+        Each group numbers its figures from 1, with the name of its first section as a file name
+        prefix; the numbers are shifted when the output is assembled in document order.
+        """
+        import multiprocessing, concurrent.futures
+        global _worker_doc
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            print('DocPublisher: parallel execution requires "fork": running serially', file=sys.stderr)
+            return self._run_sections(cache, raise_if_exception)
+
+        names = list(self.doc_info.sections.keys())
+        ok = self._run_sections(cache, raise_if_exception, only=names[:1])
+        if not ok: return ok
+
+        _worker_doc = (self, cache)
+        try:
+            context = multiprocessing.get_context('fork')
+            with concurrent.futures.ProcessPoolExecutor(nworkers, mp_context=context) as pool:
+                results = list(pool.map(_run_group, self.doc_info.section_groups()))
+        finally:
+            _worker_doc = None
+
+        for group_ok, _ in results:
+            if group_ok is None: return None
+            ok = ok and group_ok
+        entries = sorted(sum([entries for _, entries in results], []), key=lambda e: e[0])
+        for sid, function, selected, cells, nfigs in entries:
+            self.display_on = selected and not self.client_mode
+            start = len(self._data)
+            self._add_cells(cells, offset=self.object_replacer.figure_number)
+            self.object_replacer.figure_number += nfigs
+            self._section_log.append((sid, function, selected, start, len(self._data), nfigs))
+            self._section_done()
+            if not selected and not self.client_mode:
+                print(f'Not displaying: {sid:5} {function}')
+        if not ok and raise_if_exception:
+            raise Exception('Section(s) failed in a parallel worker')
+        return ok
 
-            self.save(quiet=self.client_mode, append=s)
+    def _section_key(self, function, args, parent_key, parent_code_key):
+        # hashes of everything that determines the output of a section function: 
+        # all, and all but its docstring
+        import inspect
+        fun = getattr(self.__class__, function)
+        try:
+            source = inspect.getsource(fun)
+        except (OSError, TypeError):
+            return None, None # not in a file, e.g., defined in a notebook: cannot cache
+        replacer = self.object_replacer
+        common = (self.__doc__, args, self.declared_inputs(), self.version, 
+                replacer.figure_number, replacer.figure_prefix)
+        return (SectionCache.key(source, *common, parent_key),
+                SectionCache.key(code_hash(fun), *common, parent_code_key))
+
+    def declared_inputs(self):
+        """Return the state of the attributes named in an "inputs" entry of the class docstring:
+        the value, or for a file name, its size and modification time
+        """
+        inputs = getattr(self, 'inputs', [])
+        if isinstance(inputs, str): inputs = inputs.replace(',', ' ').split()
+        state = []
+        for name in inputs:
+            value = getattr(self, name, None)
+            if isinstance(value, str) and os.path.isfile(os.path.expandvars(value)):
+                st = os.stat(os.path.expandvars(value))
+                value = (value, st.st_size, st.st_mtime)
+            state.append((name, repr(value)))
+        return state
+
+    def _replay_section(self, funarg, record, cache):
+        # add the cached cells to the document, and restore the figure files, renumbered if the section
+        # now starts at another figure number, as it may for a section replayed without its key
+        replacer = self.object_replacer
+        offset = replacer.figure_number - record.get('fig_start', replacer.figure_number)
+        cells, rename = record['cells'], {}
+        if offset:
+            prefix = replacer.figure_prefix+'_' if replacer.figure_prefix else ''
+            for fn in record['files']:
+                m = figure_file.match(fn)
+                if m: rename[fn] = f'{m.group(1) or ""}{prefix}fig_{int(m.group(2))+offset:02d}.png'
+        if rename:
+            pattern = re.compile('|'.join(re.escape(fn) for fn in rename))
+            cells = [(mimetype, pattern.sub(lambda m: rename[m.group(0)], text)) for mimetype, text in cells]
+        cache.restore_files(funarg, record, self.doc_folders, replacer.store, rename)
+        self._add_cells(cells, offset=offset)
+        replacer.figure_number += record['nfigs']
+
+    def post_publish(self, user_doc, doc, vars):
+        # save a snapshot of the symbols if the section output will be cached
+        if getattr(self, '_snapshots', None) is not None:
+            self._snapshots[len(self._data)-1] = dict(user_doc=user_doc, 
+                    **snapshot(doc, vars, self.object_replacer))
+
+    def _rerender_section(self, funarg, record, cache)->bool:
+        """Add the section's cells to the document, formatting those made by publishme with 
+        the current docstring and the saved symbols, rather than running the function.
+        Return False, having done nothing, if a docstring refers to a symbol that was not saved.
+        """
+        import inspect, pickle
+        from .helpers import field_names, field_root
+        snapshots = cache.get_snapshots(funarg)
+        if snapshots is None: return False
+        function = funarg.split('.')[0]
+        docstring = inspect.getdoc(getattr(self, function))
+
+        class SavedSelf(object):
+            # the document, with attribute values saved when the section was run
+            def __init__(self, doc, attrs):
+                self.__dict__.update(attrs)
+                self.__doc_obj = doc
+            def __getattr__(self, name):
+                return getattr(self.__doc_obj, name)
+
+        # check that all fields can be resolved, and set up each symbol table
+        prepared = {}
+        for i, snap in snapshots.items():
+            doc = snap['user_doc'] or docstring
+            attrs = dict((k, pickle.loads(v)) for k, v in snap['attrs'].items())
+            vars = dict(self.predefined, self=SavedSelf(self, attrs))
+            for name, (kind, value) in snap['vars'].items():
+                vars[name] = pickle.loads(value) if kind=='pickle' else value
+            for field in field_names(doc):
+                t = field.split('[')[0].split('.')
+                if t[0]=='self' and len(t)>1:
+                    if t[1] not in attrs and not hasattr(self, t[1]): return False
+                elif t[0] not in vars:
+                    return False
+            prepared[i] = (doc, vars)
+
+        cache.restore_files(funarg, record, self.doc_folders, self.object_replacer.store)
+        self.name = function
+        issub = self._current_index[1]>0
+        if issub:
+            # the snapshot has the parent section's symbols
+            saved_symbols, self._saved_symbols = getattr(self, '_saved_symbols', {}), {}
+        for i, (mimetype, text) in enumerate(record['cells']):
+            if i not in prepared:
+                self._add_cells([(mimetype, text)])
+                continue
+            doc, saved = prepared[i]
+            # same sequence as publishme
+            vars = self.predefined.copy()
+            doc = self.process_doc(doc, vars)
+            vars.update(saved)
+            md_data = doc_formatter(doc, vars)
+            self._data += (md_data,)
+            self._display(md_data)
+        if issub: self._saved_symbols = saved_symbols
+        self.object_replacer.figure_number += record['nfigs']
+        return True
+
+    def _restore_symbols(self, funarg):
+        # run a replayed section again, quietly, for its symbols, discarding its output
+        ff = funarg.split('.')
+        index, display_on = self._current_index, self.display_on
+        start, nfig, nfiles = len(self._data), self.object_replacer.figure_number, len(self.object_replacer.files)
+        self._current_index, self.display_on = [index[0], 0], False
+        snapshots, self._snapshots = getattr(self, '_snapshots', None), None
+        try:
+            getattr(self, ff[0])(*ff[1:])
+        finally:
+            self._snapshots = snapshots
+            del self._data[start:]
+            self.object_replacer.figure_number = nfig
+            del self.object_replacer.files[nfiles:]
+            self._current_index, self.display_on = index, display_on
 
     def update_index(self):
 
@@ -181,28 +520,7 @@ class DocPublisher(Publisher):
         """
         indexer = DocIndexer(self)
         indexer.save() # updates the yaml index 
-        
-        docman = self.docman
-        
-        # check to see if there is a class named "Index" and it is not this
-        if 'Index' in docman.doc_classes and self.docname!='Index':
-            print(f'Running the Index document for {self.docname}')
-            docman('Index')()
-            return
-
-        if hasattr(docman, 'indexdoc', ) and docman.indexdoc:
-            # DocMan has found an Index declaration, a yaml string, in the __init__.py of this package
-            # use it with DocIndex to create a document to save in the docpath folder
-            
-            print(f'Updating index, applying "Index" declaration in __index__.py')
-            indexdoc = docman.indexdoc
-        else:
-            indexdoc = f"title: Documents in folder {os.path.split(self.docpath)[-1]} "
-
-        Index.__doc__ = indexdoc
-        di  = Index(docpath=self.docpath, docname='Index')
-        di(save_ok=False)
-        di.save()
+        run_index(self.docman, self.docpath, self.docname)
     
     def process_doc(self, doc, vars):
         """Override the base class to add document features to the output of a doc function
@@ -254,6 +572,56 @@ class DocPublisher(Publisher):
         return doc
 
 
+def run_index(docman, docpath, docname='', **kwargs:'for the Index constructor'):
+    """Make the index document in docpath, from the yaml index
+    """
+    # check to see if there is a class named "Index" and it is not this
+    if 'Index' in docman.doc_classes and docname!='Index':
+        print(f'Running the Index document for {docname}' if docname else 'Running the Index document')
+        docman('Index', **kwargs)()
+        return
+
+    if hasattr(docman, 'indexdoc', ) and docman.indexdoc:
+        # DocMan has found an Index declaration, a yaml string, in the __init__.py of this package
+        # use it with DocIndex to create a document to save in the docpath folder
+        
+        print(f'Updating index, applying "Index" declaration in __index__.py')
+        indexdoc = docman.indexdoc
+    else:
+        indexdoc = f"title: Documents in folder {os.path.split(docpath)[-1]} "
+
+    Index.__doc__ = indexdoc
+    di  = Index(docpath=docpath, docname='Index', **kwargs)
+    di(save_ok=False)
+    di.save()
+    di._notify('done', ok=True, saved=True)
+
+# set by DocPublisher._run_parallel for the forked worker processes: (document, cache)
+_worker_doc = None
+
+def _run_group(names):
+    # in a worker process: run a group of sections, return the status and output of each
+    doc, cache = _worker_doc
+    doc.client_mode = True # no display, or messages about it
+    doc._data = [] # not the parent's spool, if any
+    replacer = doc.object_replacer
+    replacer.clear()
+    replacer.figure_prefix = names[0]
+    ok = doc._run_sections(cache, False, only=names)
+    return ok, [(sid, function, selected, doc._cells(start, end), nfigs)
+                for sid, function, selected, start, end, nfigs in doc._section_log]
+
+# the name of a figure file, made by the FigureWrapper, perhaps with a prefix
+figure_file = re.compile(r'(.*/)?(?:\w+_)?fig_(\d+)\.png$')
+
+def renumber_figures(text, offset):
+    # add offset to the figure numbers in the captions and alt text made for figures and images,
+    # marked with the class jupydoc_fignum, not others that the docstring may contain
+    if not offset: return text
+    return re.sub(r'(<b class="jupydoc_fignum">Figure |<img class="jupydoc_fignum" src="[^"]*" alt="Figure )(\d+)',
+            lambda m: m.group(1)+str(int(m.group(2))+offset), text)
+
+
 class Index(DocPublisher):
     """
     title: |
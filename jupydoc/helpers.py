@@ -3,8 +3,7 @@ jupydoc helper class DocInfo, functions doc_formatter and md_to_html
 
 """
 import sys, os
-import string, pprint , collections
-from nbconvert.exporters import  HTMLExporter
+import string, _string, pprint , collections, functools
 
 
 class DocInfo(collections.OrderedDict):
@@ -49,6 +48,7 @@ class DocInfo(collections.OrderedDict):
             self.parse_section_string(section_string)
        
         self.__dict__.update(self)
+        self.depends = self.parse_depends(doc_dict.get('depends', {}))
 
     def __iter__(self):
         # set up iterator
@@ -119,6 +119,47 @@ class DocInfo(collections.OrderedDict):
                 subs = False 
             elif not subs  : current_section = self['sections'][token] = []
             else:            current_section.append(token)
+
+    def parse_depends(self, depends:'dict, section name: names of earlier sections it uses'):
+        # return a dict of sets of section names; a subsection stands for its section
+        section_of = {}
+        for sect, subs in self['sections'].items():
+            section_of[sect] = sect
+            for sub in subs: section_of[sub] = sect
+        names = list(self['sections'].keys())
+        if not isinstance(depends, dict):
+            raise Exception(f'Expected "depends" to be a dict, not {depends}')
+        ret = {}
+        for name, uses in depends.items():
+            if isinstance(uses, str): uses = uses.replace(',', ' ').split()
+            for t in [name]+list(uses):
+                if t not in section_of:
+                    raise Exception(f'Name "{t}" in "depends" entry is not a section or subsection')
+            sect = section_of[name]
+            for t in uses:
+                used = section_of[t]
+                if names.index(used) > names.index(sect):
+                    raise Exception(f'Section "{sect}" cannot depend on a later section, "{used}"')
+                if used!=sect: ret.setdefault(sect, set()).add(used)
+        return ret
+
+    def section_groups(self)->'list of lists of section names':
+        """Partition the sections, except the title page, into groups that are independent of each other
+        A section is in the same group as the sections it depends on; each group is in document order
+        """
+        names = list(self['sections'].keys())[1:]
+        group = dict((name, {name}) for name in names)
+        for sect, uses in self.depends.items():
+            for used in uses:
+                if used not in group or group[used] is group[sect]: continue
+                merged = group[sect] | group[used]
+                for name in merged: group[name] = merged
+        groups = []
+        for name in names:
+            g = sorted(group[name], key=names.index)
+            if g[0]==name: groups.append(g)
+        return groups
+
     @property
     def names(self):
         nm = []
@@ -158,6 +199,67 @@ class DocInfo(collections.OrderedDict):
 
 #-----------------------------------------------------------
 
+class Unformatted:
+    # stands in for a name that is not in the symbol table: formats as the original field
+    def __init__(self, key):
+        self.key = key
+    def format(self, format_spec):
+        return "{{{}{}}}".format(self.key, ":" + format_spec if format_spec else "")
+
+class MimeBundleObject(object):
+    def __init__(self, mimetype, text):
+        self.mimetype, self.text = mimetype, text
+    def _repr_mimebundle_(self, include=None, exclude=None):
+        return {self.mimetype: self.text}
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(text:'a format string', 
+        recursion_depth=2,
+        )->'tuple of literal strings and (key, lookups, conversion, format spec plan) tuples':
+    # Parse text once, as string.Formatter.vformat would, into a plan for substitute.
+    # Automatic field numbering continues into nested format specs, so it is threaded through. 
+    auto_arg_index = [0]
+    def plan(text, recursion_depth):
+        if recursion_depth < 0:
+            raise ValueError('Max string recursion exceeded')
+        result = []
+        for literal_text, field_name, format_spec, conversion in _formatter.parse(text):
+            if literal_text:
+                result.append(literal_text)
+            if field_name is None: continue
+            if field_name == '':
+                if auto_arg_index[0] is False:
+                    raise ValueError('cannot switch from manual field specification to automatic field numbering')
+                field_name = str(auto_arg_index[0])
+                auto_arg_index[0] += 1
+            elif field_name.isdigit():
+                if auto_arg_index[0]:
+                    raise ValueError('cannot switch from manual field specification to automatic field numbering')
+                auto_arg_index[0] = False
+            first, rest = _string.formatter_field_name_split(field_name)
+            result.append((first, tuple(rest), conversion, plan(format_spec, recursion_depth-1)))
+        return tuple(result)
+    return plan(text, recursion_depth)
+
+def substitute(template_plan:'from compile_template', vars:'variable dict')->str:
+    # Fill in a plan: fields whose name is not in vars are left as they were
+    out = []
+    for item in template_plan:
+        if type(item)==str:
+            out.append(item)
+            continue
+        key, lookups, conversion, spec_plan = item
+        obj = vars.get(key, Unformatted(key))
+        for is_attr, i in lookups:
+            obj = getattr(obj, i) if is_attr else obj[i]
+        if conversion is not None:
+            obj = _formatter.convert_field(obj, conversion)
+        format_spec = substitute(spec_plan, vars) if spec_plan else ''
+        out.append(obj.format(format_spec) if isinstance(obj, Unformatted) else format(obj, format_spec))
+    return ''.join(out)
+
+_formatter = string.Formatter()
+
 def doc_formatter(
         text:'text string to process',
         vars:'variable dict'={}, 
@@ -165,121 +267,63 @@ def doc_formatter(
     )->'MimeBundleObject':
     # Returns an object that can be displayed by IPython, interpreted as the mimetype
 
-    # Use a string.Formatter subclass to ignore bracketed names that are not found
+    # Like a string.Formatter that ignores bracketed names that are not found, 
     #adapted from  https://stackoverflow.com/questions/3536303/python-string-format-suppress-silent-keyerror-indexerror
-
-    class Formatter(string.Formatter):
-        class Unformatted:
-            def __init__(self, key):
-                self.key = key
-            def format(self, format_spec):
-                return "{{{}{}}}".format(self.key, ":" + format_spec if format_spec else "")
-
-        def vformat(self, format_string,  kwargs):
-            try:
-                return super().vformat(format_string, [], kwargs)
-            except AttributeError as msg:
-                return f'Docstring formatting failed: {msg.args[0]}'
-        def get_value(self, key, args, kwargs):
-            return kwargs.get(key, Formatter.Unformatted(key))
-
-        def format_field(self, value, format_spec):
-            if isinstance(value, Formatter.Unformatted):
-                return value.format(format_spec)
-            #print(f'\tformatting {value} with spec {format_spec}') #', object of class {eval(value).__class__}')
-            return format(value, format_spec)
-               
-    docx = Formatter().vformat(text+'\n', vars)  if vars else text     
+    # but with the parsed template cached
+    if vars:
+        try:
+            docx = substitute(compile_template(text+'\n'), vars)
+        except AttributeError as msg:
+            docx = f'Docstring formatting failed: {msg.args[0]}'
+    else: docx = text
     # enhances this: docx = text.format(**vars)
 
-    class MimeBundleObject(object):
-        def _repr_mimebundle_(self, include=None, exclude=None):
-            return {mimetype: docx}
+    return MimeBundleObject(mimetype, docx)
 
-    return MimeBundleObject()
-
-def md_to_html(output, filename, title='jupydoc'):
-    """write nbconverted markdown to a file 
+def md_to_html(output, filename, title='jupydoc', 
+        renderer:'name of a renderer in jupydoc.renderers.renderers; None for the default'=None,
+        fragment_folder:'if set, folder to keep the HTML for each cell, to reuse if unchanged'=None,
+        ):
+    """write rendered markdown to a file 
     
     parameters
     ----------
-    output : string | tuple | IPython.utils.capture.CapturedIO object
+    output : string | tuple | list | CellSpool | IPython.utils.capture.CapturedIO object
         if not a string extract the markdown from each of the outputs list 
     """
-    class Dict(dict):
-        def __init__(self, **kwargs):
-            self.__dict__.update(kwargs)
-            self.update(kwargs)
-       
+    from .renderers import get_renderer, FragmentCache, CellSpool
+
+    if isinstance(output, CellSpool):
+        # already rendered 
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        output.write_page(filename, title)
+        return
+
     if type(output)==str:
         # just a markdown string
-        cells= [Dict(cell_type="markdown", 
-                         metadata={}, 
-                         source=output,
-                        )
-                   ]
+        cells = [output]
    
-    elif type(output)==tuple:
-        # a tuple of displayable objects
+    elif type(output) in (tuple, list):
+        # a sequence of displayable objects
         cells = []
         for obj in output:
             mimetype, text = list(obj._repr_mimebundle_().items())[0]
-            if mimetype=='text/markdown':
-
-                cell = Dict(cell_type='markdown',
-                    metadata={},
-                    source = text,
-                )
-            # elif mimetype=='text/html':
-            #     # HTML output has to kluge as a code cell that created it
-            #     # (But couldn't get this to work)
-            #     cell = Dict(
-            #         cell_type='code',
-            #         metadata={},
-            #         source=[],
-            #         execution_count=1,
-            #         output_type='execute_result',
-            #         outputs =[ 
-            #             {'data':
-            #                 {'text/html': [text] ,
-            #                  'text/plain':[''],
-            #                 }
-            #             }
-            #            ] ,                   
-            #         )
-            else:
+            if mimetype!='text/markdown':
                 raise Exception(f'Unrecognized mimetype:{mimetype}')
-
-            cells.append( cell)
-
-            
+            cells.append(text)
 
     elif hasattr(output, 'outputs'):
         # a CapturedIO object? assume all markdwon si guess (never used this)
         text=''
         for t in output.outputs:            
             text += '\n\n'+t.data['text/markdown']
-        cells= [Dict(cell_type="markdown", 
-                         metadata={}, 
-                         source=text,
-                        )
-                   ]
+        cells = [text]
     else:
         raise Exception(f'output not recognized: {output.__class__} not a string, tuple, or CapturedIO object?')
 
-    nb = Dict(
-            cells=cells,
-            metadata={},
-            nbformat=4,
-            nbformat_minor=4,
-            )
-    # print('Converting to HTML')
-    # now pass it to nbconvert to write as an HTML file
-    exporter = HTMLExporter()
-    output, resources = exporter.from_notebook_node(nb) 
-    
-    # Change the title from default "Notebook"
-    output = output.replace('Notebook', title)
+    fragments = FragmentCache(fragment_folder) if fragment_folder else None
+    output = get_renderer(renderer).page(cells, title, fragments=fragments)
+    if fragments: fragments.prune()
     
     # print(f'writing rendered HTML to {filename}')
     if filename:
@@ -291,6 +335,21 @@ def md_to_html(output, filename, title='jupydoc'):
         # for debugging
         return output
         
+def field_names(text:'a format string')->'set of field names, e.g. "x" or "self.date"':
+    # names in the replacement fields of text, including any nested in format specs
+    names = set()
+    try:
+        for _, field_name, format_spec, _ in string.Formatter().parse(text):
+            if field_name: names.add(field_name)
+            if format_spec and '{' in format_spec: names |= field_names(format_spec)
+    except ValueError:
+        pass # not a valid format string: doc_formatter will complain
+    return names
+
+def field_root(field_name):
+    # the symbol name that a field starts with: "x" for "x.attr" or "x[0]"
+    return field_name.split('.')[0].split('[')[0]
+
 #---------------------------------------------------------------------------------
 def test_formatter():
     
@@ -5,14 +5,16 @@ import numpy as np
 
 class DocIndexer(dict ):
 
-    def __init__(self, doc:'A jupydoc.DocPublisher object',
-               verbose=False):
+    def __init__(self, doc:'A jupydoc.DocPublisher object, or None to use docspath'=None,
+               verbose=False,
+               docspath:'the folder, if doc is None'=None,
+               ):
         
-        if not hasattr(doc, 'docpath') or not hasattr(doc, 'doc_info'):
+        if doc is not None and (not hasattr(doc, 'docpath') or not hasattr(doc, 'doc_info')):
             raise Exception('Expected a DocPublisher object')
 
         # set up index entry with info from the doc
-        self.docspath = doc.docpath
+        self.docspath = doc.docpath if doc is not None else docspath
         self.verbose=verbose
         self.index_file = os.path.join(self.docspath, 'index.yaml')
         
@@ -33,23 +35,26 @@ class DocIndexer(dict ):
                 print(f'DocIndexer is removing entry for missing document {key}')
                 self.pop(key)
         
+        if doc is None: return
         # get current doc info as dict
         info = doc.doc_info
-        t ={}
         if doc.docname != 'Index' and doc.docname != 'DocIndex':
             # make, or update an entry if it isn't an index
-
-            t[doc.docname] = dict(
-                        title=info.get('title','').split('\n')[0] ,
-                        date= info.get('date', str(datetime.datetime.now())[:16]), 
-                        author=info.get('author', '').split('\n')[0],
-                        info=getattr(doc, 'info', {}),
-            )
-            self.update(t)
+            self[doc.docname] = self.entry(doc)
         else:
             # this is an "Index" document
             self.index_doc = info
 
+    @staticmethod
+    def entry(doc)->'dict for the index entry of a document':
+        info = doc.doc_info
+        return dict(
+                    title=info.get('title','').split('\n')[0] ,
+                    date= info.get('date', str(datetime.datetime.now())[:16]), 
+                    author=info.get('author', '').split('\n')[0],
+                    info=getattr(doc, 'info', {}),
+        )
+
     def _repr_html_(self ): 
 
         doc= f'<table order="1" style="margin-left: 10px; text-align: left; vertical-align: text-top;">\n'
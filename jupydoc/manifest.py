@@ -0,0 +1,152 @@
+"""
+Build manifests: for each document, a record of the inputs it was built from, and the output files it made
+
+A manifest is saved as a json file in the document folder after each build. A document is "stale", and
+needs to be built again, if its module, a module of its package that was loaded, a file that its module
+declares in __depends__, the jupydoc code, or an output file differs from what the manifest recorded.
+The package modules are found by following the import statements of the module source.
+"""
+import os, sys, json, hashlib
+from pathlib import Path
+
+manifest_name = '.jupydoc_manifest.json'
+
+def file_hash(filename)->'sha1 of the contents, or None if not readable':
+    try:
+        with open(filename, 'rb') as inp:
+            return hashlib.sha1(inp.read()).hexdigest()
+    except OSError:
+        return None
+
+def jupydoc_hash():
+    folder = os.path.dirname(__file__)
+    h = hashlib.sha1()
+    for name in sorted(os.listdir(folder)):
+        if name.endswith('.py'):
+            h.update(name.encode()+(file_hash(os.path.join(folder, name)) or '').encode())
+    return h.hexdigest()
+
+def output_files(folder)->'dict, path relative to folder: hash, excluding dot files and folders':
+    ret = {}
+    for path, dirs, files in os.walk(folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in sorted(files):
+            if name.startswith('.'): continue
+            filename = os.path.join(path, name)
+            ret[os.path.relpath(filename, folder)] = file_hash(filename)
+    return ret
+
+def module_file(name:'dotted module name',
+                roots:'dict, top name: spec, to reuse'=None,
+               )->'the source file of the module, or None':
+    # by path, from the location of the top package, so that no package is imported
+    import importlib.machinery
+    module = sys.modules.get(name)
+    if getattr(module, '__file__', None):
+        return os.path.abspath(module.__file__)
+    top, _, rest = name.partition('.')
+    roots = {} if roots is None else roots
+    if top not in roots:
+        try:
+            roots[top] = importlib.machinery.PathFinder.find_spec(top)
+        except (ImportError, ValueError):
+            roots[top] = None
+    spec = roots[top]
+    if not spec: return None
+    if not spec.submodule_search_locations:
+        return None if rest else spec.origin
+    folder = Path(list(spec.submodule_search_locations)[0], *rest.split('.')) if rest else None
+    for fn in ([folder/'__init__.py', folder.with_suffix('.py')] if folder else [Path(spec.origin or '')]):
+        if fn.is_file(): return str(fn.absolute())
+    return None
+
+def imported_names(filename, parent:'package for relative imports')->'list of the module names, some perhaps not modules':
+    # the import statements, anywhere in the source
+    import ast, importlib.util
+    try:
+        with open(filename, 'rb') as inp:
+            tree = ast.parse(inp.read())
+    except (OSError, SyntaxError, ValueError):
+        return []
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            base = '.'*node.level + (node.module or '')
+            try:
+                base = importlib.util.resolve_name(base, parent) if node.level else base
+            except (ImportError, ValueError):
+                continue
+            names.append(base)
+            # "from package import module"
+            names.extend(f'{base}.{alias.name}' for alias in node.names if alias.name!='*')
+    return names
+
+def imported_files(module_name:'name of a module of the package',
+                   package:'the top package name, to limit the search'=None,
+                   parsed:'dict, file: imported names, to reuse; remove the files that change'=None,
+                  )->'dict, name: file, of the module, its packages, and the package modules that it imports':
+    # found by following the import statements
+    package = package or module_name.split('.')[0]
+    parsed = {} if parsed is None else parsed
+    found, todo, roots = {}, [module_name], {}
+    while todo:
+        name = todo.pop()
+        if name in found or name.split('.')[0]!=package: continue
+        filename = module_file(name, roots)
+        if not filename: continue
+        found[name] = filename
+        if '.' in name: todo.append(name.rpartition('.')[0])
+        if filename not in parsed:
+            parent = name if os.path.basename(filename)=='__init__.py' else name.rpartition('.')[0]
+            parsed[filename] = imported_names(filename, parent)
+        todo.extend(parsed[filename])
+    return found
+
+def dependency_files(module_name, parsed=None)->'list of file names':
+    # the package modules that the module imports, and any files declared in its __depends__
+    from . import docman as docman_module
+    files = set(imported_files(module_name, parsed=parsed).values())
+    files.update(os.path.abspath(fn) for fn in docman_module.loaded.get(module_name, {}))
+    return sorted(files)
+
+def write_manifest(doc:'a DocPublisher, made by DocMan, just saved'):
+    docman = doc.docman
+    classname = doc.__class__.__name__
+    module_name = docman.lookup_module.get(classname, doc.__class__.__module__)
+    module = sys.modules.get(module_name)
+    folder = doc.output_folder
+    record = dict(
+        docname = doc.docname,
+        module = module_name,
+        module_hash = file_hash(getattr(module, '__file__', '')),
+        jupydoc = jupydoc_hash(),
+        depends = dict((fn, file_hash(fn)) for fn in dependency_files(module_name)),
+        outputs = output_files(folder),
+        )
+    with open(os.path.join(folder, manifest_name), 'w') as out:
+        json.dump(record, out, indent=1)
+
+def stale_reason(docman:'a DocMan',
+                 docname:'document name, perhaps with a version',
+                )->'why the document must be built, or "" if it is up to date':
+    folder = docman.document_folder(docname)
+    try:
+        with open(os.path.join(folder, manifest_name), 'r') as inp:
+            record = json.load(inp)
+    except (OSError, ValueError):
+        return 'no manifest'
+    filename = module_file(record['module'])
+    if not filename or file_hash(filename)!=record['module_hash']:
+        return f'module {record["module"]} changed'
+    if record.get('jupydoc')!=jupydoc_hash():
+        return 'jupydoc changed'
+    for fn, h in record['depends'].items():
+        if file_hash(fn)!=h:
+            return f'dependency {fn} changed'
+    outputs = output_files(folder)
+    for fn, h in record['outputs'].items():
+        if outputs.get(fn)!=h:
+            return f'output {fn} changed or missing'
+    return ''
@@ -1,10 +1,11 @@
 """Generate documents for Jupyterlab display 
 """
 
-import os, sys, inspect, datetime
+import os, sys, shutil, inspect, datetime
 
-from .helpers import doc_formatter, md_to_html
+from .helpers import doc_formatter, md_to_html, field_names
 from .replacer import ObjectReplacer
+from .store import ContentStore, cache_path
 
 ## special style stuff at start of document
 jupydoc_css =\
@@ -30,6 +31,8 @@ class Publisher(object):
     def __init__(self, 
              docpath:'if set, save() will write the output folder to this folder'='',
              docname:'if set, will be the name of the document folder; otherwise use its class name'='', 
+             renderer:'name of the markdown-to-HTML renderer, e.g. "nbconvert"; default "markdown"'=None,
+             stream:'if set, render each cell as it is added, keeping the output in a temporary file'=False,
              **kwargs:'should be none',
             ):
         """
@@ -46,6 +49,8 @@ class Publisher(object):
                 docpath=''
 
         self.docpath = docpath
+        self.renderer = renderer
+        self.stream = stream
         module = self.__module__
         self.docname = docname or (module+'.' if module!='__main__' else '')+self.__class__.__name__
 
@@ -60,6 +65,9 @@ class Publisher(object):
         self.doc_folders = [fp, '.'] if docpath else ['.']
         
         self.object_replacer = ObjectReplacer(folders = self.doc_folders)
+        if docpath: 
+            # figure and image files are shared by all the documents in docpath
+            self.object_replacer.store = ContentStore(cache_path('store', docpath))
         
         # predefind symbols for convenience
         self.predefined= dict(
@@ -93,6 +101,7 @@ class Publisher(object):
         back =inspect.currentframe().f_back
         name= self.name = inspect.getframeinfo(back).function
         locs = inspect.getargvalues(back).locals
+        user_doc = doc
         doc = doc or inspect.getdoc(eval(f'self.{name}'))
  
         # symbol table: predefinded + locals + kwargs
@@ -101,17 +110,18 @@ class Publisher(object):
         # hook to modify either, perhaps prepend to doc, more vars
         doc  = self.process_doc(doc, vars)
 
-        # add locals and kwargs, run the object replacer
+        # add locals and kwargs, run the object replacer on those referenced by the doc
         vars.update(locs)
         vars.update(kwargs)
-        self.object_replacer(vars)
+        self.object_replacer(vars, field_names(doc))
 
         # Now use the helper function to do the formatting, replacing {xx} if xx is recognized
         md_data = doc_formatter(  doc,   vars,  )
 
         # self._data = self._data + '\n\n' + md_data._repr_mimebundle_()['text/markdown']
-        # add this displayable object to the output tuple
+        # add this displayable object to the output list
         self._data += (md_data,)
+        self.post_publish(user_doc, doc, vars)
 
         # perhaps display it
         self._display(md_data)
@@ -124,9 +134,26 @@ class Publisher(object):
             display.display( md_data )
             self._has_data = True
 
+    @property
+    def output_folder(self):
+        fullpath = os.path.abspath(self.docpath)
+        return fullpath if self.docname=='Index' else os.path.join(fullpath, self.docname)
+
+    def _new_data(self):
+        # a list of displayable objects, or a CellSpool if streaming to a saved document
+        if not (self.stream and self.docpath):
+            return []
+        from .renderers import get_renderer, FragmentCache, CellSpool
+        renderer = get_renderer(self.renderer)
+        if not renderer.per_cell:
+            print(f'Publisher: renderer "{renderer.name}" cannot stream, keeping cells in memory', file=sys.stderr)
+            return []
+        return CellSpool(renderer, FragmentCache(cache_path('fragments', self.output_folder)))
+
     def clear(self):
-        # start the objs tuple 
-        self._data = (doc_formatter(jupydoc_css + '\n<a id="top"></a>', ),)
+        # start the objs list 
+        self._data = self._new_data()
+        self._data += (doc_formatter(jupydoc_css + '\n<a id="top"></a>', ),)
         self._fignum = 0 # local convenience, not true 
         self._has_data = False
         self.object_replacer.clear() # for fig number at least
@@ -135,6 +162,11 @@ class Publisher(object):
         # do nothing in this class
         return doc
 
+    def post_publish(self, user_doc, doc, vars):
+        # hook called after publishme has added a cell, with the doc argument if any, 
+        # the processed doc, and the symbol table: do nothing in this class
+        pass
+
     def save(self, append='', quiet=False):
         """ Create Web document
         """
@@ -143,9 +175,7 @@ class Publisher(object):
             ---
             Document not saved.""")
             return
-        fullpath = os.path.abspath(self.docpath)
-        if self.docname!='Index':
-            fullpath = os.path.join(fullpath, self.docname)
+        fullpath = self.output_folder
 
         if hasattr(self, 'docman'):
             module = self.docman.lookup_module.get(self.docname, 'not found?')
@@ -160,8 +190,15 @@ class Publisher(object):
         if append:
             self.markdown(append, clean=False)
 
+        store = self.object_replacer.store
+        if store and store.auto_gc:
+            store.maybe_gc()
         html_title = self.docname if self.docname !='Index' else f'{os.path.split(self.docpath)[-1]} index'
-        md_to_html(self._data, os.path.join(fullpath,'index.html'), title=html_title) 
+        md_to_html(self._data, os.path.join(fullpath,'index.html'), title=html_title, renderer=self.renderer,
+                fragment_folder=cache_path('fragments', fullpath))
+        # caches that used to be kept in the docs folder
+        for legacy in (os.path.join(fullpath, '.fragments'), os.path.join(os.path.abspath(self.docpath), '.jupydoc_store')):
+            if os.path.isdir(legacy): shutil.rmtree(legacy, ignore_errors=True)
          
         if not quiet:
             t = f'Document {self.docname}' if self.docname else 'Index'
@@ -198,7 +235,7 @@ class Publisher(object):
         # Get, and increment, current figure number, prepend to caption.
         self.object_replacer.figure_number +=1
         fignum =  self.object_replacer.figure_number
-        caption = f'<b>Figure {fignum}</b>. '+caption
+        caption = f'<b class="jupydoc_fignum">Figure {fignum}</b>. '+caption
 
         if not os.path.isfile(filename):
             filename = os.path.join(image_path, filename)
@@ -224,16 +261,16 @@ class Publisher(object):
                 self.set_browser_folder(browser_subfolder)
                 for folder in folders:
                     self.saveto(folder)
+                replacer.files.append(self.browser_subfolder+'/'+self.name)
                 
             def set_browser_folder(self, folder):
                 self.browser_subfolder = folder
 
             def saveto(self, whereto):
-                import shutil
                 if self.error: return
                 full_path = os.path.join(whereto, self.browser_subfolder)
                 os.makedirs(full_path, exist_ok=True)
-                shutil.copyfile(filename, os.path.join(full_path,self.name) )
+                replacer.copy_file(filename, os.path.join(full_path,self.name) )
 
             def __str__(self):
                 if self.error:
@@ -249,6 +286,7 @@ class Publisher(object):
                     f'       alt="Image {self.name} at {browser_fn}">'\
                     f'\n  <figcaption>{caption}</figcaption>'\
                     '</figure></a></div>\n'
+        replacer = self.object_replacer
         r = JupydocImage(folders = self.doc_folders) 
         return r       
     
@@ -328,7 +366,7 @@ def nbdoc(userfun:'a function'):
     import matplotlib.pyplot as plt
 
     from jupydoc.replacer import ObjectReplacer
-    from jupydoc.helpers import doc_formatter, monospace, capture_print, shell
+    from jupydoc.helpers import doc_formatter, monospace, capture_print, shell, field_names
     
     import IPython.display as display
 
@@ -354,7 +392,7 @@ def nbdoc(userfun:'a function'):
         
         vars = locs
         # replace variable objects if recognized
-        orep(vars)
+        orep(vars, field_names(doc))
         # format the doc string, replacing recognized {...} with a str()
         md_data = doc_formatter(doc, vars)
         # have IPython display it
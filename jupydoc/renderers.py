@@ -0,0 +1,386 @@
+"""
+Renderers that convert a document's markdown cells to an HTML page
+
+The default, "markdown", converts each cell directly with mistune, or else the markdown package,
+and puts the results in a compact page with the same structure, CSS classes and MathJax setup
+as the nbconvert "lab" template. The "nbconvert" renderer runs nbconvert's HTMLExporter.
+
+A renderer that converts cells separately can keep the HTML fragment for each cell in a 
+FragmentCache, so that only new or changed cells are converted when a page is written again,
+and can write cells to a CellSpool as they are produced, rather than keep them in memory.
+"""
+import os, re, html, hashlib, json, tempfile
+from urllib.parse import quote
+
+try:
+    import mistune
+except ImportError:
+    mistune = None
+try:
+    import markdown
+except ImportError:
+    markdown = None
+
+# a dict of renderer classes, keyed by name, used by get_renderer
+renderers = {}
+default_renderer = 'markdown'
+
+class Renderer(object):
+    """Base class: a subclass implements cell, header and trailer, or else overrides page
+    """
+    name = ''
+    per_cell = True # converts each cell separately
+
+    def cell(self, text:'markdown text')->'HTML fragment':
+        # a subclass converts the markdown: here it is shown as is
+        return cell_template.format(body=f'<pre>{html.escape(text)}</pre>')
+
+    def header(self, title)->str:
+        return ''
+
+    def trailer(self)->str:
+        return ''
+
+    def page(self, cells:'list of markdown text', title, 
+            fragments:'a FragmentCache to use for the cells'=None,
+            )->'HTML document':
+        cell = self.cell if fragments is None else lambda text: fragments.get(text, self)
+        return self.header(title) + ''.join(cell(text) for text in cells) + self.trailer()
+
+
+class FragmentCache(object):
+    """Manage a folder of rendered cells, each in a file named with the hash of the 
+    renderer name, the version of the jupydoc code and of the converter, and the markdown text.
+    """
+    def __init__(self, folder:'folder for the fragment files'):
+        from .manifest import jupydoc_hash
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self.used = set()
+        converter = mistune or markdown
+        self.version = f'{jupydoc_hash()} {getattr(converter, "__version__", "")}'
+
+    def get(self, text:'markdown text', renderer:'a Renderer')->'HTML fragment':
+        name = hashlib.sha1(f'{renderer.name}\n{self.version}\n{text}'.encode('utf8')).hexdigest()+'.html'
+        self.used.add(name)
+        filename = os.path.join(self.folder, name)
+        if os.path.isfile(filename):
+            with open(filename, 'r', encoding='utf8') as inp:
+                return inp.read()
+        fragment = renderer.cell(text)
+        with open(filename, 'w', encoding='utf8') as out:
+            out.write(fragment)
+        return fragment
+
+    def prune(self):
+        # remove the fragments not used since this object was created
+        for name in os.listdir(self.folder):
+            if name.endswith('.html') and name not in self.used:
+                os.remove(os.path.join(self.folder, name))
+
+
+class CellSpool(object):
+    """A sequence of output cells that is kept in temporary files, rather than in memory
+
+    Each cell that is added is converted to HTML at once and appended to one file, while its mimetype
+    and text are appended to another, so the cells can still be read back, or the sequence truncated. 
+    It supports the list operations that Publisher uses: +=, len, slicing, and del of a tail slice.
+    html returns the HTML of a range of cells, and write_page writes the header, the spooled HTML and the
+    trailer to the output file.
+    """
+    def __init__(self, 
+            renderer:'a Renderer that converts cells separately', 
+            fragments:'optional FragmentCache'=None,
+            ):
+        self.renderer, self.fragments = renderer, fragments
+        # unbuffered, so that a forked process cannot write out a copy of pending data
+        self._text = tempfile.TemporaryFile(buffering=0)
+        self._html = tempfile.TemporaryFile(buffering=0)
+        self._offsets = [] # (text offset, html offset) of each cell
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def append(self, obj:'object with a _repr_mimebundle_ method'):
+        mimetype, text = list(obj._repr_mimebundle_().items())[0]
+        if mimetype!='text/markdown':
+            raise Exception(f'Unrecognized mimetype:{mimetype}')
+        self._offsets.append((self._text.tell(), self._html.tell()))
+        self._text.write((json.dumps([mimetype, text])+'\n').encode('utf8'))
+        fragment = self.fragments.get(text, self.renderer) if self.fragments else self.renderer.cell(text)
+        self._html.write(fragment.encode('utf8'))
+
+    def __iadd__(self, objs):
+        for obj in objs: self.append(obj)
+        return self
+
+    def __getitem__(self, index):
+        from .helpers import doc_formatter
+        if not isinstance(index, slice):
+            return self[index:index+1 or None][0]
+        ret = []
+        for i in range(*index.indices(len(self))):
+            self._text.seek(self._offsets[i][0])
+            mimetype, text = json.loads(self._text.readline().decode('utf8'))
+            ret.append(doc_formatter(text, mimetype=mimetype))
+        self._text.seek(0, 2)
+        return ret
+
+    def __delitem__(self, index):
+        # only a tail, like [n:], can be removed
+        start, stop, step = index.indices(len(self)) if isinstance(index, slice) else (index, index+1, 1)
+        if start>=len(self): return
+        if stop<len(self) or step!=1:
+            raise Exception('CellSpool: can only delete cells from the end')
+        text_offset, html_offset = self._offsets[start]
+        for f, offset in [(self._text, text_offset), (self._html, html_offset)]:
+            f.seek(offset); f.truncate()
+        del self._offsets[start:]
+
+    def html(self, start=0, end=None)->'the HTML of the cells from start to end, as converted when added':
+        start, end, _ = slice(start, end).indices(len(self))
+        if start>=end: return ''
+        stop = self._offsets[end][1] if end<len(self) else self._html.tell()
+        self._html.seek(self._offsets[start][1])
+        ret = self._html.read(stop-self._offsets[start][1]).decode('utf8')
+        self._html.seek(0, 2)
+        return ret
+
+    def write_page(self, filename, title):
+        import shutil
+        self._html.seek(0)
+        with open(filename, 'wb') as out:
+            out.write(self.renderer.header(title).encode('utf8'))
+            shutil.copyfileobj(self._html, out)
+            out.write(self.renderer.trailer().encode('utf8'))
+        self._html.seek(0, 2)
+        if self.fragments: self.fragments.prune()
+
+#---------------------------------------------------------------------------------
+# The page as produced by nbconvert, with only the CSS rules that apply to markdown cells
+
+page_header = """<!DOCTYPE html>
+<html lang="en">
+<head><meta charset="utf-8"/>
+<meta content="width=device-width, initial-scale=1.0" name="viewport"/>
+<title>{title}</title>
+<style type="text/css">
+body {{ margin: 0; padding: 10px; color: rgba(0, 0, 0, 0.87); font-size: 13px; }}
+a {{ text-decoration: unset; color: unset; }}
+.jp-Cell {{ padding: 5px; margin: 0; border: none; outline: none; background: transparent; }}
+.jp-InputArea {{ display: table; table-layout: fixed; width: 100%; overflow: hidden; }}
+.jp-InputPrompt {{ display: table-cell; vertical-align: top; width: 64px; padding: 5px; }}
+.jp-MarkdownOutput {{ display: table-cell; width: 100%; margin-top: 0; margin-bottom: 0; padding-left: 5px; overflow: auto; }}
+.jp-RenderedHTMLCommon {{ color: rgba(0, 0, 0, 0.87);
+    font-family: system-ui, -apple-system, blinkmacsystemfont, 'Segoe UI', helvetica, arial, sans-serif,
+        'Apple Color Emoji', 'Segoe UI Emoji', 'Segoe UI Symbol';
+    font-size: 17px; line-height: 1.6; padding-right: 20px; }}
+.jp-RenderedHTMLCommon a:link, .jp-RenderedHTMLCommon a:visited {{ text-decoration: none; color: #0d47a1; }}
+.jp-RenderedHTMLCommon a:hover {{ text-decoration: underline; color: #0d47a1; }}
+.jp-RenderedHTMLCommon h1, .jp-RenderedHTMLCommon h2, .jp-RenderedHTMLCommon h3,
+.jp-RenderedHTMLCommon h4, .jp-RenderedHTMLCommon h5, .jp-RenderedHTMLCommon h6 {{
+    line-height: 1; font-weight: 500; font-style: normal; margin: 1.2em 0 0.8em 0; }}
+.jp-RenderedHTMLCommon h1:first-child, .jp-RenderedHTMLCommon h2:first-child, .jp-RenderedHTMLCommon h3:first-child,
+.jp-RenderedHTMLCommon h4:first-child, .jp-RenderedHTMLCommon h5:first-child, .jp-RenderedHTMLCommon h6:first-child {{
+    margin-top: 0.6em; }}
+.jp-RenderedHTMLCommon h1 {{ font-size: 2.0736em; }}
+.jp-RenderedHTMLCommon h2 {{ font-size: 1.728em; }}
+.jp-RenderedHTMLCommon h3 {{ font-size: 1.44em; }}
+.jp-RenderedHTMLCommon h4 {{ font-size: 1.2em; }}
+.jp-RenderedHTMLCommon h5 {{ font-size: 17px; }}
+.jp-RenderedHTMLCommon h6 {{ font-size: 0.83333em; }}
+.jp-RenderedHTMLCommon ul:not(.list-inline), .jp-RenderedHTMLCommon ol:not(.list-inline) {{ padding-left: 2em; }}
+.jp-RenderedHTMLCommon ul {{ list-style: disc; }}
+.jp-RenderedHTMLCommon ul ul {{ list-style: square; }}
+.jp-RenderedHTMLCommon ol {{ list-style: decimal; }}
+.jp-RenderedHTMLCommon ol ol {{ list-style: upper-alpha; }}
+.jp-RenderedHTMLCommon hr {{ color: #e0e0e0; background-color: #bdbdbd; margin-top: 1em; margin-bottom: 1em; }}
+.jp-RenderedHTMLCommon pre, .jp-RenderedHTMLCommon code {{ border: 0; background-color: white; color: rgba(0, 0, 0, 0.87);
+    font-family: menlo, consolas, 'DejaVu Sans Mono', monospace; font-size: inherit; line-height: 1.3077;
+    padding: 0; white-space: pre-wrap; }}
+.jp-RenderedHTMLCommon pre {{ font-size: 16px; border: none; margin: 0; padding: 0; }}
+.jp-RenderedHTMLCommon :not(pre) > code {{ background-color: #eeeeee; padding: 1px 5px; }}
+.jp-RenderedHTMLCommon table {{ border-collapse: collapse; border-spacing: 0; border: none; color: rgba(0, 0, 0, 0.87);
+    font-size: 13px; table-layout: fixed; margin-left: auto; margin-bottom: 1em; margin-right: auto; }}
+.jp-RenderedHTMLCommon thead {{ border-bottom: 1px solid #bdbdbd; vertical-align: bottom; }}
+.jp-RenderedHTMLCommon td, .jp-RenderedHTMLCommon th, .jp-RenderedHTMLCommon tr {{ vertical-align: middle; padding: 0.5em;
+    line-height: normal; white-space: normal; max-width: none; border: none; }}
+.jp-RenderedHTMLCommon th {{ font-weight: bold; }}
+.jp-RenderedHTMLCommon tbody tr:nth-child(odd) {{ background: white; }}
+.jp-RenderedHTMLCommon tbody tr:nth-child(even) {{ background: #f5f5f5; }}
+.jp-RenderedHTMLCommon tbody tr:hover {{ background: #e1f5fe; }}
+.jp-RenderedHTMLCommon p {{ text-align: left; margin: 0; margin-bottom: 1em; }}
+.jp-RenderedHTMLCommon img, .jp-RenderedHTMLCommon svg {{ max-width: 100%; height: auto; }}
+.jp-RenderedHTMLCommon > img {{ display: block; margin-left: 0; margin-right: 0; margin-bottom: 1em; }}
+.jp-RenderedHTMLCommon blockquote {{ margin: 1em 2em; padding: 0 1em; border-left: 5px solid #e0e0e0; }}
+a.anchor-link {{ display: none; }}
+@media print {{ .jp-Collapser {{ display: none; }} }}
+</style>
+<!-- Load mathjax -->
+<script src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.7/latest.js?config=TeX-AMS_CHTML-full,Safe"> </script>
+<!-- MathJax configuration -->
+<script type="text/x-mathjax-config">
+    init_mathjax = function() {{
+        if (window.MathJax) {{
+        // MathJax loaded
+            MathJax.Hub.Config({{
+                TeX: {{
+                    equationNumbers: {{
+                    autoNumber: "AMS",
+                    useLabelIds: true
+                    }}
+                }},
+                tex2jax: {{
+                    inlineMath: [ ['$','$'], ["\\\\(","\\\\)"] ],
+                    displayMath: [ ['$$','$$'], ["\\\\[","\\\\]"] ],
+                    processEscapes: true,
+                    processEnvironments: true
+                }},
+                displayAlign: 'center',
+                messageStyle: 'none',
+                CommonHTML: {{
+                    linebreaks: {{
+                    automatic: true
+                    }}
+                }}
+            }});
+
+            MathJax.Hub.Queue(["Typeset", MathJax.Hub]);
+        }}
+    }}
+    init_mathjax();
+    </script>
+<!-- End of mathjax configuration --></head>
+<body class="jp-Notebook" data-jp-theme-light="true" data-jp-theme-name="JupyterLab Light">
+<main>
+"""
+
+page_trailer = """</main>
+</body>
+</html>
+"""
+
+cell_template = """<div class="jp-Cell jp-MarkdownCell jp-Notebook-cell">
+<div class="jp-Cell-inputWrapper" tabindex="0">
+<div class="jp-Collapser jp-InputCollapser jp-Cell-inputCollapser">
+</div>
+<div class="jp-InputArea jp-Cell-inputArea"><div class="jp-InputPrompt jp-InputArea-prompt">
+</div><div class="jp-RenderedHTMLCommon jp-RenderedMarkdown jp-MarkdownOutput" data-mime-type="text/markdown">
+{body}
+</div>
+</div>
+</div>
+</div>
+"""
+
+# LaTeX that must not be seen by the markdown converter, as in nbconvert: display, environment, inline
+math_pattern = re.compile(r'\$\$.+?\$\$|\\\[.+?\\\]|\\begin\{([a-z]+\*?)\}.+?\\end\{\1\}'
+                          r'|(?<!\\)\$[^$\n]+?(?<!\\)\$|\\\(.+?\\\)', re.DOTALL)
+# headings made from markdown, marked by the converter, get anchors; not those in raw HTML
+heading_mark = 'data-jupydoc-anchor'
+heading_pattern = re.compile(r'<h([1-6]) '+heading_mark+r'(?:="")?>(.*?)</h\1>', re.DOTALL)
+
+def _marked_heading(text, level):
+    return f'<h{level} {heading_mark}>{text}</h{level}>\n'
+
+def markdown_converter()->'function to convert markdown to HTML, marking the headings':
+    if mistune and hasattr(mistune, 'create_markdown'):
+        class HTMLRenderer(mistune.HTMLRenderer):
+            def heading(self, text, level, **attrs):
+                return _marked_heading(text, level)
+        return mistune.create_markdown(renderer=HTMLRenderer(escape=False), plugins=['strikethrough', 'table'])
+    if mistune:
+        class HTMLRenderer(mistune.Renderer):
+            def header(self, text, level, raw=None):
+                return _marked_heading(text, level)
+        return mistune.Markdown(renderer=HTMLRenderer(escape=False))
+    if markdown:
+        from markdown.treeprocessors import Treeprocessor
+        from markdown.extensions import Extension
+        class MarkHeadings(Treeprocessor):
+            def run(self, root):
+                for el in root.iter():
+                    if el.tag in ('h1', 'h2', 'h3', 'h4', 'h5', 'h6'): el.set(heading_mark, '')
+        class MarkHeadingsExtension(Extension):
+            def extendMarkdown(self, md):
+                md.treeprocessors.register(MarkHeadings(md), 'jupydoc_headings', 5)
+        md = markdown.Markdown(extensions=['tables', 'fenced_code', MarkHeadingsExtension()])
+        return lambda text: md.reset().convert(text)
+    raise ImportError('The markdown renderer needs either the mistune or the markdown package')
+
+class MarkdownRenderer(Renderer):
+    """Convert markdown directly, with mistune if available, otherwise the markdown package
+    """
+    name = 'markdown'
+
+    def __init__(self):
+        self._convert = markdown_converter()
+
+    def cell(self, text):
+        # set aside the math, convert, restore the math, then add heading anchors as nbconvert does
+        maths = []
+        def save_math(m):
+            maths.append(m.group(0))
+            return f'jupydocmath{len(maths)-1}x'
+        body = self._convert(math_pattern.sub(save_math, text))
+        body = re.sub(r'jupydocmath(\d+)x', lambda m: html.escape(maths[int(m.group(1))], quote=False), body)
+        return cell_template.format(body=heading_pattern.sub(self._anchor, body.strip()))
+
+    @staticmethod
+    def _anchor(m):
+        level, contents = m.groups()
+        if not contents.strip(): return f'<h{level}>{contents}</h{level}>'
+        link = quote(html.unescape(re.sub(r'<[^>]*>', '', contents)).replace(' ', '-'),
+                safe="?/:@!$&'()*+,;=")
+        return f'<h{level} id="{link}">{contents}<a class="anchor-link" href="#{link}">¶</a></h{level}>'
+
+    def header(self, title):
+        return page_header.format(title=html.escape(title))
+
+    def trailer(self):
+        return page_trailer
+
+renderers['markdown'] = MarkdownRenderer
+
+
+class NbconvertRenderer(Renderer):
+    """Make a notebook with a markdown cell for each, and run the nbconvert HTMLExporter.
+    The cells are not converted separately, so fragments are not used.
+    """
+    name = 'nbconvert'
+    per_cell = False
+
+    def __init__(self):
+        from nbconvert.exporters import HTMLExporter
+        self.exporter = HTMLExporter()
+
+    def page(self, cells, title, fragments=None):
+        class Dict(dict):
+            def __init__(self, **kwargs):
+                self.__dict__.update(kwargs)
+                self.update(kwargs)
+
+        nb = Dict(
+                cells=[Dict(cell_type='markdown', metadata={}, source=text) for text in cells],
+                metadata={},
+                nbformat=4,
+                nbformat_minor=4,
+                )
+        output, resources = self.exporter.from_notebook_node(nb)
+
+        # Change the title from default "Notebook"
+        return output.replace('Notebook', title)
+
+renderers['nbconvert'] = NbconvertRenderer
+
+
+def get_renderer(name:'key in renderers; if None, default_renderer'=None)->Renderer:
+    name = name or default_renderer
+    if name not in renderers:
+        raise Exception(f'Renderer "{name}" not in {list(renderers.keys())}')
+    try:
+        return renderers[name]()
+    except ImportError:
+        if name!=default_renderer: raise
+        # the default needs a markdown package: use nbconvert, which depends on mistune anyway
+        return NbconvertRenderer()
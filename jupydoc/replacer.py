@@ -4,10 +4,12 @@ THis defines a jupydoc helper which manages creation of HTML for objects of sele
 For such classes, replace the object in the variable dictionary with a new one that implements a __str__ function, which returns
 markdown, usually HTML.
 
-Implemented here: dict, wrappers for plt.Figure, pd.Dataframe
+Implemented here: dict, wrappers for plt.Figure, pd.Dataframe, np.ndarray
 """
-import os, shutil
+import os, sys, io, shutil, hashlib, html, itertools
 import pprint 
+from .store import write_if_changed
+from .helpers import field_root
 
 try:
     import matplotlib.pyplot as plt
@@ -17,10 +19,21 @@ try:
     import pandas as pd
 except:
     pd=None
+try:
+    import numpy as np
+except:
+    np=None
 
 
 # a dict accumulated here, used to initialze set of wrappers for ObjectReplacer
+# key: a class, or the name of a class; value: (wrapper class, kwargs)
 wrappers = {}
+
+def register(cls:'class, or class name, whose instances, including of subclasses, are replaced', 
+             wrapper:'the replacement class, a Wrapper subclass', 
+             **kwargs:'to apply to new objects'):
+    # add to the wrappers used to initialize each ObjectReplacer
+    wrappers[cls] = (wrapper, kwargs)
                      
 class Wrapper(object):
     """Base class for the replacement classes
@@ -77,7 +90,7 @@ if plt:
                 # the caption, which may be absent.
                 caption = getattr(fig,'caption', '')
                 if caption is not None:
-                    caption = f'<b>Figure {n}</b>. ' + getattr(fig,'caption', '').format(**self.vars)
+                    caption = f'<b class="jupydoc_fignum">Figure {n}</b>. ' + getattr(fig,'caption', '').format(**self.vars)
                     figcaption = f' <figcaption>{caption}</figcaption>'
                 else: figcaption=''
 
@@ -85,62 +98,425 @@ if plt:
                 fn = os.path.join(self.folder_name, f'{prefix}fig_{n:02d}.png')
                 browser_fn =fn
                 
-                # actually save it for the document, perhaps both in the local, and document folders
-                for folder in self.fig_folders:
-                    fig.savefig(os.path.join(folder,fn), bbox_inches='tight', pad_inches=0.5)#, **fig_kwargs)
+                # actually save it for the document
+                self._save(fig, fn)
                 plt.close(fig) 
+                self.replacer.files.append(fn)
                 img_width = f'width={fig.width}' if hasattr(fig,'width') else ''
 
                 # add the HTML as an attribute, to insert the image, including  caption
                 self._html =\
                     f'<div class="{self.fig_class}">'\
                       f'<figure>'\
-                        f'   <img src="{browser_fn}" alt="Figure {n} at {browser_fn}" {img_width}>'\
+                        f'   <img class="jupydoc_fignum" src="{browser_fn}" alt="Figure {n} at {browser_fn}" {img_width}>'\
                         f' {figcaption}' \
                       '</figure>'\
                     '</div>\n'
             return self._html
 
+        def _save(self, fig, fn):
+            # render it once, then write the bytes to the local and document folders
+            buf = io.BytesIO()
+            fig.savefig(buf, format='png', bbox_inches='tight', pad_inches=0.5)#, **fig_kwargs)
+            data = buf.getvalue()
+            for folder in self.fig_folders:
+                self.replacer.write_file(os.path.join(folder,fn), data)
+
     # def __str__(self):
     #     return str(self.img)
 
-    wrappers['Figure'] = (FigureWrapper, {'folder_name': 'images'}) # was 'figs', but this is OK, what nbdev wants
+    register(plt.Figure, FigureWrapper, folder_name='images') # was 'figs', but this is OK, what nbdev wants
 
 if pd:
     class DataFrameWrapper(Wrapper): 
+        """Display a DataFrame as an HTML table, showing the first and last rows if there are more than max_rows.
+        Float columns are formatted with float_format, if it is a python format spec like ".3f" or ",.2f",
+        for only the rows shown, rather than by pandas calling a function. A table with more than sidecar_rows rows is 
+        also written to a file in the tables folder, in csv.gz or parquet format, with a link to it.
+        """
         def __init__(self, *pars, **kwargs):
 
             super().__init__(*pars, **kwargs)
             self._df = self.obj
             kwargs.pop('replacer') # rest should be OK
+            self.float_format = kwargs.pop('float_format', None)
+            if isinstance(self.float_format, str):
+                try:
+                    format(0.0, self.float_format)
+                except ValueError as e:
+                    print(f'DataFrameWrapper: ignoring float_format "{self.float_format}": {e}', file=sys.stderr)
+                    self.float_format = None
+            self.sidecar_rows = kwargs.pop('sidecar_rows', None)
+            self.sidecar_format = kwargs.pop('sidecar_format', 'csv.gz')
+            self.preview_rows = kwargs.pop('preview_rows', 10)
+            self.folder_name = kwargs.pop('folder_name', 'tables')
             self.kw = kwargs
 
         def __str__(self):
             if not hasattr(self, '_html'):
-                self._html = self._df.to_html(**self.kw)                
+                key = self._cache_key()
+                hit = table_cache.get(key) if key else None
+                if hit and self._restore_files(hit[1]):
+                    self._html = hit[0]
+                    return self._html
+                nfiles = len(self.replacer.files)
+                self._html = self._render()
+                if key:
+                    files = [(fn, os.path.join(self.replacer.document_folders[0], fn)) 
+                            for fn in self.replacer.files[nfiles:]]
+                    table_cache.put(key, self._html, files)
             return self._html
+
+        def _cache_key(self):
+            # a hash of the contents and the formatting options, or None if the contents cannot be hashed
+            df = self._df
+            try:
+                h = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+            except TypeError:
+                return None
+            options = (self.float_format, self.sidecar_rows, self.sidecar_format, self.preview_rows, 
+                       self.folder_name, sorted(self.kw.items()))
+            h.update(repr((list(df.columns), list(df.dtypes), df.index.names, options)).encode('utf8'))
+            return h.hexdigest()
+
+        def _restore_files(self, files):
+            # make sure the files that the cached HTML links to are in this document
+            for fn, source in files:
+                if not os.path.isfile(source): return False
+                for folder in self.replacer.document_folders:
+                    dest = os.path.join(folder, fn)
+                    if os.path.abspath(dest)==os.path.abspath(source): continue
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    self.replacer.copy_file(source, dest)
+                self.replacer.files.append(fn)
+            return True
+
+        def _render(self)->'the HTML':
+            df, kw = self._df, self.kw.copy()
+            link = ''
+            if self.sidecar_rows is not None and len(df) > self.sidecar_rows:
+                link = self._sidecar()
+                if not kw.get('max_rows') or kw['max_rows'] > self.preview_rows:
+                    kw['max_rows'] = self.preview_rows
+            if not isinstance(self.float_format, str):
+                # let pandas truncate, and call float_format if set
+                return link + df.to_html(float_format=self.float_format, **kw)
+            dimensions = kw.pop('show_dimensions', False)
+            html = link + self._preview(df, kw.pop('max_rows', None), kw.get('na_rep', 'NaN')).to_html(**kw)
+            if dimensions:
+                html += f'<p>{len(df)} rows × {len(df.columns)} columns</p>\n'
+            return html
+
+        def _preview(self, df, max_rows, na_rep):
+            # the rows to show, with floats formatted, and a row of "..." if any are left out
+            if not max_rows or len(df) <= max_rows:
+                return format_floats(df, self.float_format, na_rep)
+            n = max(max_rows//2, 1)
+            df = format_floats(pd.concat([df.iloc[:n], df.iloc[-n:]]), self.float_format, na_rep)
+            dots = pd.DataFrame([['...']*len(df.columns)], columns=df.columns, index=['...'])
+            return pd.concat([df.iloc[:n].astype(object), dots, df.iloc[n:].astype(object)])
+
+        def _sidecar(self):
+            # write the full table, return a link to it
+            df, fmt = self._df, self.sidecar_format
+            data = None
+            if fmt=='parquet':
+                try:
+                    buf = io.BytesIO()
+                    df.to_parquet(buf)
+                    data = buf.getvalue()
+                except Exception as e:
+                    print(f'DataFrameWrapper: cannot write parquet ({str(e).splitlines()[0]}), using csv.gz', 
+                        file=sys.stderr)
+                    fmt = 'csv.gz'
+            if data is None:
+                import gzip
+                # mtime=0 so the same table gives the same bytes; level 1 is much faster, nearly as small
+                data = gzip.compress(df.to_csv(index=False).encode('utf8'), mtime=0, compresslevel=1)
+            fn = f'{self.folder_name}/table_{hashlib.sha1(data).hexdigest()[:12]}.{fmt}'
+            for folder in self.replacer.document_folders:
+                os.makedirs(os.path.join(folder, self.folder_name), exist_ok=True)
+                self.replacer.write_file(os.path.join(folder, fn), data)
+            self.replacer.files.append(fn)
+            size = f'{len(data)/1e6:.1f} MB' if len(data)>1e5 else f'{len(data)/1e3:.1f} kB'
+            return f'<p><a href="{fn}" download>Full table</a>: {len(df)} rows × {len(df.columns)} columns, {fmt}, {size}</p>\n'
+
+    def format_floats(df:'a DataFrame', spec:'format spec, e.g. ".3f" or ",.2f"', na_rep='NaN')->'a copy with strings':
+        # convert each float column to strings, with the python format spec
+        import numpy as np
+        out = df.copy()
+        for i, dtype in enumerate(df.dtypes):
+            if getattr(dtype, 'kind', '')!='f': continue
+            values = df.iloc[:,i].to_numpy()
+            text = np.array([format(v, spec) for v in values.tolist()], dtype=object)
+            text[np.isnan(values)] = na_rep
+            out.isetitem(i, text)
+        return out
+
     df_kwargs= dict( notebook=True, 
                     max_rows=6, 
                     index=False,
                     show_dimensions=False, #True, 
                     justify='right',
-                    float_format=lambda x: f'{x:.3f}',
+                    float_format='.3f',
+                    sidecar_rows=1000,
                     )
-    wrappers['DataFrame'] = (DataFrameWrapper,  df_kwargs) 
+    register(pd.DataFrame, DataFrameWrapper, **df_kwargs) 
+
+class TableCache(object):
+    """Rendered HTML of tables, with the files it links to, kept for any later wrapper of the same table
+    The least recently used entries are dropped when the total size of the HTML exceeds max_size.
+    """
+    def __init__(self, max_size:'characters'=50_000_000):
+        import collections
+        self.max_size = max_size
+        self.entries = collections.OrderedDict() # key: (html, [(file name, where written)])
+        self.size = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None: self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, html, files=[]):
+        if len(html) > self.max_size: return
+        old = self.entries.pop(key, None)
+        if old: self.size -= len(old[0])
+        self.entries[key] = (html, files)
+        self.size += len(html)
+        while self.size > self.max_size:
+            _, (h, _) = self.entries.popitem(last=False)
+            self.size -= len(h)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+# shared by all documents in this process
+table_cache = TableCache()
+
+class _More(object):
+    # stands for what was left out of a container: sorts after anything else
+    def __init__(self, text): self.text = text
+    def __repr__(self): return self.text
+    def __lt__(self, other): return False
+    def __gt__(self, other): return True
+
+def budgeted(obj, max_depth, max_items, max_total=None, depth=0, _left=None)->'(copy, True if anything was left out)':
+    # a copy of obj with at most max_items in each container, max_total in all, and none nested deeper than max_depth
+    if not isinstance(obj, (dict, list, tuple, set, frozenset)):
+        return obj, False
+    left = _left or [max_total if max_total is not None else float('inf')] # shared by the recursive calls
+    n = len(obj)
+    if depth >= max_depth and n:
+        return _More('{...%d}' % n if isinstance(obj, dict) else '[...%d]' % n), True
+    cut = False
+    if isinstance(obj, dict):
+        ret = {}
+        for i, (k, v) in enumerate(obj.items()):
+            if i==max_items or left[0]<=0:
+                ret[_More(f'...{n-i} more')] = _More('...')
+                cut = True
+                break
+            left[0] -= 1
+            ret[k], c = budgeted(v, max_depth, max_items, max_total, depth+1, left)
+            cut |= c
+        return ret, cut
+    items = []
+    for i, v in enumerate(obj):
+        if i==max_items or left[0]<=0:
+            items.append(_More(f'...{n-i} more'))
+            cut = True
+            break
+        left[0] -= 1
+        v, c = budgeted(v, max_depth, max_items, max_total, depth+1, left)
+        items.append(v)
+        cut |= c
+    # the base class, since a subclass, like a named tuple, may not be constructed from a list
+    return next(t for t in (list, tuple, set, frozenset) if isinstance(obj, t))(items), cut
 
 class PPWrapper(Wrapper):
-    """Use PrettyPrint
+    """Use PrettyPrint, within a budget: if there are more than max_items in a container, max_total
+    in all, more than max_depth levels, or more than max_chars characters, show what fits, after a summary line. 
+    The full text is then added as a collapsed <details> element if full="details",
+    or written to a file in the data folder, with a link, if full="file". 
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.max_depth = kwargs.get('max_depth', 6)
+        self.max_items = kwargs.get('max_items', 100)
+        self.max_total = kwargs.get('max_total', 2000)
+        self.max_chars = kwargs.get('max_chars', 20_000)
+        self.full = kwargs.get('full', None)
+        self.folder_name = kwargs.get('folder_name', 'data')
+
+    # also for a subclass: a docstring field like {p.name}, {p[key]} or {p:>10} is meant for the object itself
+    def __format__(self, spec):
+        return format(self.obj, spec) if spec else str(self)
+
+    def __getitem__(self, key):
+        return self.obj[key]
+
+    def __getattr__(self, name):
+        if name=='obj': raise AttributeError(name)
+        return getattr(self.obj, name)
 
     def __str__(self):
         pp = pprint.PrettyPrinter(indent=2)
-        text = pp.pformat(self.obj)#.replace('\n', '<br>\n')
-        return f'<p style="margin-left: {self.indent}"><samp>{text}</samp></p>'
+        obj, cut = budgeted(self.obj, self.max_depth, self.max_items, self.max_total)
+        text = pp.pformat(self.obj if not cut else obj)#.replace('\n', '<br>\n')
+        if len(text) > self.max_chars:
+            text, cut = text[:self.max_chars]+'\n...', True
+        if not cut:
+            return f'<p style="margin-left: {self.indent}"><samp>{text}</samp></p>'
+        return f'<p style="margin-left: {self.indent}"><em>{self.summary()}</em>{self.full_text(pp)}<br>'\
+               f'<samp>{text}</samp></p>'
+
+    def summary(self):
+        obj = self.obj
+        what = 'keys' if isinstance(obj, dict) else 'items'
+        types = sorted(set(type(x).__name__ for x in itertools.islice(obj, self.max_items)))
+        of = f' of {", ".join(types[:3])}{", ..." if len(types)>3 else ""}' if types else ''
+        return f'{type(obj).__name__}: {len(obj)} {what}{of}; abbreviated'
 
-wrappers['dict'] = (PPWrapper, {} )
-wrappers['list'] = (PPWrapper, {} )
+    def full_text(self, pp):
+        # on request, the full text
+        if self.full=='details':
+            return f'<details><summary>full text</summary><samp>{pp.pformat(self.obj)}</samp></details>'
+        if self.full=='file':
+            data = pp.pformat(self.obj).encode('utf8')
+            fn = f'{self.folder_name}/pp_{hashlib.sha1(data).hexdigest()[:12]}.txt'
+            for folder in self.replacer.document_folders:
+                os.makedirs(os.path.join(folder, self.folder_name), exist_ok=True)
+                self.replacer.write_file(os.path.join(folder, fn), data)
+            self.replacer.files.append(fn)
+            return f' (<a href="{fn}">full text</a>)'
+        return ''
+
+register(dict, PPWrapper)
+register(list, PPWrapper)
+
+if np:
+    def array_chunks(arr, chunk_size):
+        # flattened pieces of arr, of about chunk_size elements, so a memmap is read a piece at a time
+        if arr.ndim==0:
+            yield arr.reshape(1)
+            return
+        step = max(1, chunk_size // max(1, arr[:1].size))
+        for i in range(0, len(arr), step):
+            yield np.asarray(arr[i:i+step]).ravel()
+
+    def array_stats(arr:'numeric ndarray', 
+            chunk_size=1<<20, 
+            exact_size:'largest size for exact quantiles'=1<<22,
+            quantiles=(0.05, 0.25, 0.5, 0.75, 0.95), 
+            bins=1000,
+            histogram:'also return the histogram'=False,
+            )->'dict':
+        """Summary statistics of the finite values, computed a chunk at a time; a bool array is counted as 0 and 1.
+        Quantiles of large arrays are interpolated from a histogram with the given number of bins. 
+        """
+        def chunks():
+            for chunk in array_chunks(arr, chunk_size):
+                yield chunk.view(np.uint8) if chunk.dtype.kind=='b' else chunk
+        n = nan = inf = 0
+        lo, hi, total = np.inf, -np.inf, 0.0
+        for chunk in chunks():
+            if chunk.dtype.kind=='f':
+                nan += np.count_nonzero(np.isnan(chunk))
+                finite = np.isfinite(chunk)
+                inf += chunk.size - np.count_nonzero(finite) - np.count_nonzero(np.isnan(chunk))
+                chunk = chunk[finite]
+            if not chunk.size: continue
+            n += chunk.size
+            lo, hi = min(lo, chunk.min()), max(hi, chunk.max())
+            total += chunk.sum(dtype=np.float64)
+        stats = dict(size=arr.size, count=n, nan=nan, inf=inf)
+        if not n: return stats
+        stats.update(min=lo, max=hi, mean=total/n)
+
+        # a second pass for the histogram, or quantiles, if wanted
+        if not quantiles and not histogram:
+            return stats
+        if arr.size <= exact_size:
+            values = np.asarray(arr, dtype=np.float64).ravel()
+            values = values[np.isfinite(values)]
+            if quantiles: stats['quantiles'] = dict(zip(quantiles, np.quantile(values, quantiles)))
+            if histogram: stats['histogram'] = np.histogram(values, bins=bins, range=(lo, hi) if hi>lo else None)
+            stats['exact'] = True
+            return stats
+        edges = np.linspace(lo, hi, bins+1) if hi>lo else np.array([lo-0.5, lo+0.5])
+        counts = np.zeros(len(edges)-1, dtype=np.int64)
+        for chunk in chunks():
+            chunk = chunk[np.isfinite(chunk)] if chunk.dtype.kind=='f' else chunk
+            counts += np.histogram(chunk, bins=edges)[0]
+        cdf = np.concatenate([[0], np.cumsum(counts)])/n
+        if quantiles: stats['quantiles'] = dict(zip(quantiles, np.interp(quantiles, cdf, edges)))
+        if histogram: stats['histogram'] = (counts, edges)
+        stats['exact'] = False
+        return stats
+
+    def svg_histogram(counts, width=200, height=40, nbars=50)->'an inline SVG element':
+        # combine the counts into at most nbars bars
+        counts = np.asarray(counts)
+        if len(counts) > nbars:
+            counts = np.add.reduceat(counts, np.linspace(0, len(counts), nbars, endpoint=False).astype(int))
+        top = counts.max() or 1
+        w = width/len(counts)
+        bars = ''.join(f'<rect x="{i*w:.1f}" y="{height*(1-c/top):.1f}" width="{w:.1f}" height="{height*c/top:.1f}"/>'
+                       for i, c in enumerate(counts) if c)
+        return f'<svg width="{width}" height="{height}" style="fill: steelblue">{bars}</svg>'
+
+    class ArrayWrapper(Wrapper):
+        """Describe an array by its shape, dtype and, if numeric, statistics, rather than its values.
+        An array with at most small_size elements is shown as str() shows it. Numeric arrays are read in 
+        chunks, so a memmap of any size is summarized in bounded memory; set histogram=True for an inline plot.
+        """
+        def __init__(self, *pars, **kwargs):
+            super().__init__(*pars, **kwargs)
+            self.small_size = kwargs.get('small_size', 100)
+            self.histogram = kwargs.get('histogram', False)
+            self.chunk_size = kwargs.get('chunk_size', 1<<20)
+
+        # a docstring field like {a.shape}, {a[0]} or {a:.2f} is meant for the array itself
+        def __format__(self, spec):
+            return format(self.obj, spec) if spec else str(self)
+
+        def __getitem__(self, index):
+            return self.obj[index]
+
+        def __getattr__(self, name):
+            if name=='obj': raise AttributeError(name)
+            return getattr(self.obj, name)
+
+        def __str__(self):
+            if not hasattr(self, '_html'):
+                self._html = self._render()
+            return self._html
+
+        def _render(self):
+            arr = self.obj
+            if arr.size <= self.small_size:
+                return str(arr)
+            header = f'<samp>{type(arr).__name__} shape {arr.shape}, {html.escape(str(arr.dtype))}</samp>'
+            if arr.dtype.kind not in 'biuf':
+                return f'<p style="margin-left: {self.indent}">{header}</p>'
+            stats = array_stats(arr, self.chunk_size, histogram=self.histogram)
+            g = lambda x: f'{x:.4g}'
+            names, values = [], []
+            for name in 'min max mean'.split():
+                if name in stats: names.append(name); values.append(g(stats[name]))
+            approx = '' if stats.get('exact', True) else '≈'
+            for q, x in stats.get('quantiles', {}).items():
+                names.append(f'{approx}{100*q:g}%'); values.append(g(x))
+            for name in 'nan inf'.split():
+                if stats[name]: names.append(name.replace('nan','NaN')); values.append(str(stats[name]))
+            row = lambda tag, items: '<tr>'+''.join(f'<{tag}>{x}</{tag}>' for x in items)+'</tr>'
+            table = f'<table>{row("th", names)}{row("td", values)}</table>'
+            hist = svg_histogram(stats['histogram'][0]) if self.histogram and 'histogram' in stats else ''
+            return f'<div style="margin-left: {self.indent}">{header}\n{table}{hist}</div>\n'
+
+    register(np.ndarray, ArrayWrapper)
 
 class ImageWrapper(Wrapper):
     """ Wrap IPython.display.Image
@@ -158,20 +534,24 @@ class ObjectReplacer(dict):
     """
     Functor that will replace objects in a variables dictionary
     It is a dictionary,
-        key: a name of a class to have its instances replaced
+        key: a class, or the name of a class, to have its instances replaced
         value: tuple with two elements: 
             1. the replacement class, which implements a __str__ method
             2. kwargs to apply to new object
+    A value's class and its bases are looked up in order, a name before a class at each level;
+    the result is saved for each class.
     """
     def __init__(self, 
                  folders:'one or more document folders to save images'=['.'], 
                  figure_prefix:'prefix for figure filename'='',
                 ):
 
+        self._type_cache = {}
         self.update(wrappers)
         self.set_folders(folders)
         self.figure_number=0
         self.figure_prefix = figure_prefix
+        self.store = None # optional ContentStore for the files
         self.debug=False
         
     # def add_rep(self, class_name:'name of class to replace', 
@@ -190,22 +570,66 @@ class ObjectReplacer(dict):
 
     def clear(self):
         self.figure_number= 0
+        self.files = [] # names of figure or image files written, relative to the document folders
  
     @property
     def folders(self):
         return self.document_folders
 
-    def __call__(self, vars):
+    def write_file(self, filename:'file to write', data:'bytes'):
+        # write a figure or image file, unless it already has these bytes
+        if self.store:
+            self.store.install(data, filename)
+        else:
+            write_if_changed(filename, data)
+
+    def copy_file(self, src:'file to copy', dest:'destination file'):
+        with open(src, 'rb') as inp:
+            self.write_file(dest, inp.read())
+
+    def register(self, cls, wrapper, **kwargs):
+        # add or replace the wrapper for cls, for this replacer only
+        self[cls] = (wrapper, kwargs)
+
+    def __setitem__(self, key, value):
+        self._type_cache.clear()
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._type_cache.clear()
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._type_cache.clear()
+        super().update(*args, **kwargs)
+
+    def wrapper_for(self, value)->'(wrapper class, kwargs) or None':
+        cls = type(value)
+        try:
+            return self._type_cache[cls]
+        except KeyError:
+            pass
+        ret = None
+        if not issubclass(cls, Wrapper): # already replaced
+            for base in cls.__mro__:
+                ret = self.get(base.__name__, None) or self.get(base, None)
+                if ret: break
+        self._type_cache[cls] = ret
+        return ret
+
+    def __call__(self, vars, 
+            fields:'field names used by the docstring; if None, replace all values'=None):
         """for each value in the vars dict, replace it with a new object that
         implements return of appropriate HTML for the original object
-        (Note uses the *class name*, which may not be unique, as a key)
+        Only values referenced by fields are replaced, so unused objects are not rendered, or numbered.
         """
+        roots = None if fields is None else set(field_root(f) for f in fields)
         for key,value in vars.items():
-            tkey = value.__class__.__name__
+            if roots is not None and key not in roots: continue
             if self.debug:
-                print(f'{key}: {tkey} ')
+                print(f'{key}: {value.__class__.__name__} ')
 
-            new_class, kwargs = self.get(tkey, (None,None))
+            new_class, kwargs = self.wrapper_for(value) or (None, None)
             
             if new_class:
                 newvalue = new_class(value, vars, replacer=self, **kwargs)
@@ -214,13 +638,13 @@ class ObjectReplacer(dict):
     def test(self, var:'any object'):
         """Test replacement for a given value. print str(var) before and after replacement
         """
-        _class = var.__class__
-        _name = _class.__name__
-        if _name not in self:
+        _name = var.__class__.__name__
+        entry = self.wrapper_for(var)
+        if not entry:
             print(f'no subsitution for class {_name}: "{var}"')
             return
 
-        print(f'replacement: {self[_name]}')
+        print(f'replacement: {entry}')
         print(f'{"-"*37}before{"-"*37}\n{var}\n')
         # make a simple vars dict: key is the variable name, value its object
         vars = {'x': var}
@@ -0,0 +1,132 @@
+"""
+Local preview server for a docs folder
+
+Serves the files of the folder, adding to each HTML page a script that listens for build events
+sent with server-sent events. While a document is built, the output of each section is shown as
+soon as it is finished, above the previous version, which is dimmed; the page is reloaded when
+the document is saved.
+"""
+import os, sys, json, queue, threading
+import http.server
+
+events_path = '/_jupydoc/events'
+
+live_script = """
+<script>
+(function() {
+    var parts = location.pathname.split('/').filter(function(p) { return p && !p.endsWith('.html'); });
+    var docname = parts.length ? decodeURIComponent(parts[parts.length-1]) : 'Index';
+    var main = document.querySelector('main') || document.body;
+    var live = null;
+    var source = new EventSource('%s');
+    source.addEventListener('start', function(e) {
+        if (JSON.parse(e.data).docname != docname) return;
+        for (var child of main.children) child.style.opacity = 0.35;
+        live = document.createElement('div');
+        live.innerHTML = '<p style="color:#0d47a1">Building...</p>';
+        main.insertBefore(live, main.firstChild);
+    });
+    source.addEventListener('section', function(e) {
+        var data = JSON.parse(e.data);
+        if (data.docname != docname || !live || data.html === null) return;
+        var div = document.createElement('div');
+        div.innerHTML = data.html;
+        live.insertBefore(div, live.lastChild);
+    });
+    source.addEventListener('done', function(e) {
+        var data = JSON.parse(e.data);
+        if (data.docname != docname) return;
+        if (data.saved) location.reload();
+        else if (!data.ok && live) live.lastChild.outerHTML = '<p class="errorText" style="color:red">Build failed</p>';
+    });
+})();
+</script>
+""" % events_path
+
+class Broadcaster(object):
+    """Send events to each connected client, through a queue for each"""
+    def __init__(self):
+        self.clients = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self):
+        q = queue.Queue()
+        with self.lock: self.clients.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock: self.clients.discard(q)
+
+    def send(self, event:'event name', data:'dict, sent as json'):
+        message = f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode('utf8')
+        with self.lock:
+            for q in self.clients: q.put(message)
+
+    def listener(self, doc, event, **info):
+        # for docpub.build_listeners
+        self.send(event, dict(docname=doc.docname, **info))
+
+class PreviewHandler(http.server.SimpleHTTPRequestHandler):
+    broadcaster = None # set by the server
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path==events_path:
+            return self.send_events()
+        filename = self.translate_path(path)
+        if os.path.isdir(filename) and path.endswith('/'):
+            filename = os.path.join(filename, 'index.html')
+        if filename.endswith('.html') and os.path.isfile(filename):
+            return self.send_page(filename)
+        super().do_GET()
+
+    def send_page(self, filename):
+        with open(filename, 'rb') as inp:
+            page = inp.read()
+        script = live_script.encode('utf8')
+        i = page.rfind(b'</body>')
+        page = page[:i]+script+page[i:] if i>=0 else page+script
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def send_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        q = self.broadcaster.subscribe()
+        try:
+            while True:
+                try:
+                    message = q.get(timeout=15)
+                except queue.Empty:
+                    message = b': keep alive\n\n'
+                self.wfile.write(message)
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.broadcaster.unsubscribe(q)
+
+    def end_headers(self):
+        # once for every response: pages, images and figures change when rebuilt
+        self.send_header('Cache-Control', 'no-cache')
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(docspath:'folder to serve',
+                 port:'port number; 0 for any free one'=8000,
+                 host:'address to bind'='127.0.0.1',
+                )->'(server, broadcaster); the server runs in a daemon thread':
+    broadcaster = Broadcaster()
+    handler = type('Handler', (PreviewHandler,), dict(broadcaster=broadcaster))
+    def make_handler(*args, **kwargs):
+        return handler(*args, directory=docspath, **kwargs)
+    server = http.server.ThreadingHTTPServer((host, port), make_handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, broadcaster
@@ -0,0 +1,110 @@
+"""
+Content-addressed storage for the figure and image files of documents
+
+A file written for a document is kept once in a store folder, as a "blob" named with the hash of
+its bytes, and hard-linked to each place it is needed. A file whose bytes have not changed is not
+rewritten, so its modification time is preserved, and identical files, in any of the documents
+sharing the store, use the space of one. Blobs that are no longer linked to are removed by gc().
+The store, like the other caches, is kept outside the docs folder, which is published.
+"""
+import os, sys, time, hashlib, tempfile
+
+def cache_path(kind:'the kind of cache, e.g. "store"', folder:'the output folder that it is for')->str:
+    # a folder in the jupydoc cache folder, not in the output folder
+    from .docman import cache_folder
+    folder = os.path.abspath(folder)
+    h = hashlib.sha1(folder.encode('utf8')).hexdigest()[:12]
+    return os.path.join(cache_folder(), kind, f'{os.path.basename(folder)}-{h}')
+
+
+def write_if_changed(filename:'file to write', data:'bytes')->'True if the file was written':
+    try:
+        if os.path.getsize(filename)==len(data):
+            with open(filename, 'rb') as inp:
+                if inp.read()==data: return False
+    except OSError:
+        pass
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    if os.path.lexists(filename):
+        os.remove(filename) # it may be a link to a blob, which must not be modified
+    with open(filename, 'wb') as out:
+        out.write(data)
+    return True
+
+def copy_if_changed(src:'file to copy', dest:'destination file')->'True if dest was written':
+    with open(src, 'rb') as inp:
+        return write_if_changed(dest, inp.read())
+
+
+class ContentStore(object):
+    """Manage a folder of blobs, in subfolders named by the first two characters of the hash.
+
+    It must be on the same file system as the document folders for links to be made; otherwise,
+    and where links are not supported, the files are copied, but still only if changed.
+    """
+    auto_gc = True # run maybe_gc from Publisher.save: python -m jupydoc build clears it
+
+    def __init__(self, root:'folder for the blobs'):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def blob(self, data:'bytes', ext:'file extension'='')->'filename of the blob':
+        h = hashlib.sha1(data).hexdigest()
+        filename = os.path.join(self.root, h[:2], h+ext)
+        if not os.path.isfile(filename):
+            folder = os.path.dirname(filename)
+            os.makedirs(folder, exist_ok=True)
+            # write to a temporary file and rename it, since another process may want the same blob
+            fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp')
+            with os.fdopen(fd, 'wb') as out:
+                out.write(data)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, filename)
+        return filename
+
+    def install(self, data:'bytes', dest:'file to create or update')->'True if dest was changed':
+        blob = self.blob(data, os.path.splitext(dest)[1])
+        try:
+            if os.path.samefile(blob, dest): return False
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+        tmp = dest+'.jupydoc_tmp'
+        try:
+            if os.path.lexists(tmp): os.remove(tmp)
+            os.link(blob, tmp)
+            os.replace(tmp, dest)
+        except OSError:
+            return write_if_changed(dest, data)
+        return True
+
+    def install_file(self, src:'file to copy', dest:'file to create or update')->'True if dest was changed':
+        with open(src, 'rb') as inp:
+            return self.install(inp.read(), dest)
+
+    def gc(self, grace:'seconds: a newer blob may be about to be linked'=600)->'number of blobs removed':
+        # a blob with a single link is not used by any document; temporary files are being written
+        removed = 0
+        with open(os.path.join(self.root, '.last_gc'), 'w'): pass
+        cutoff = time.time()-grace
+        for sub in os.scandir(self.root):
+            if not sub.is_dir(): continue
+            for entry in os.scandir(sub.path):
+                if entry.name.startswith('.'): continue
+                try:
+                    st = entry.stat()
+                    if entry.is_file() and st.st_nlink==1 and st.st_mtime<cutoff:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError as e:
+                    print(f'ContentStore: could not remove {entry.path}: {e}', file=sys.stderr)
+        return removed
+
+    def maybe_gc(self, interval:'seconds'=3600)->'number of blobs removed, or None if not run':
+        # run gc if it has not been run for the interval
+        try:
+            if time.time()-os.path.getmtime(os.path.join(self.root, '.last_gc'))<interval:
+                return None
+        except OSError:
+            pass
+        return self.gc()
@@ -0,0 +1,178 @@
+"""
+Watch the source files of a package, to rebuild the documents affected by a change
+
+Uses inotify, with the optional package inotify_simple, or else polls the modification times.
+"""
+import os, re, sys, time, json, hashlib, importlib
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+def source_files(folders:'folders to search', extra:'other files to include'=())->'dict, file: (mtime_ns, size)':
+    ret = {}
+    def add(filename):
+        try:
+            st = os.stat(filename)
+            ret[filename] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            pass
+    for folder in folders:
+        for path, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if not d.startswith('.') and d!='__pycache__']
+            for name in files:
+                if name.endswith('.py'): add(os.path.join(path, name))
+    for filename in extra: add(filename)
+    return ret
+
+class PollingWatcher(object):
+    """Compare the modification times and sizes of the files every `interval` seconds"""
+    def __init__(self, folders, extra=(), interval=0.5):
+        self.folders, self.interval = folders, interval
+        self.watch_files(extra)
+
+    def watch_files(self, extra):
+        self.extra = set(extra)
+        self.state = source_files(self.folders, self.extra)
+
+    def poll(self, timeout:'seconds to wait for a change')->'set of changed files':
+        end = time.time()+timeout
+        while True:
+            new = source_files(self.folders, self.extra)
+            changed = set(fn for fn in set(new)|set(self.state) if new.get(fn)!=self.state.get(fn))
+            self.state = new
+            if changed or time.time()>=end:
+                return changed
+            time.sleep(min(self.interval, max(end-time.time(), 0)))
+
+class InotifyWatcher(object):
+    """Watch the folders of the tree, and of the extra files, with inotify"""
+    def __init__(self, folders, extra=()):
+        self.inotify = inotify_simple.INotify()
+        f = inotify_simple.flags
+        self.mask = f.CLOSE_WRITE | f.MOVED_TO | f.MOVED_FROM | f.CREATE | f.DELETE
+        self.wds = {} # watch descriptor: folder
+        for folder in folders:
+            for path, dirs, _ in os.walk(folder):
+                dirs[:] = [d for d in dirs if not d.startswith('.') and d!='__pycache__']
+                self.add(path)
+        self.watch_files(extra)
+
+    def add(self, folder):
+        if folder in self.wds.values(): return
+        try:
+            self.wds[self.inotify.add_watch(folder, self.mask)] = folder
+        except OSError as e:
+            print(f'Cannot watch {folder}: {e}', file=sys.stderr)
+
+    def watch_files(self, extra):
+        self.extra = set(extra)
+        for fn in self.extra: self.add(os.path.dirname(fn))
+
+    def poll(self, timeout):
+        changed = set()
+        for event in self.inotify.read(timeout=int(timeout*1000)):
+            folder = self.wds.get(event.wd)
+            if folder is None or not event.name: continue
+            filename = os.path.join(folder, event.name)
+            if event.mask & inotify_simple.flags.ISDIR:
+                if event.mask & inotify_simple.flags.CREATE and not event.name.startswith('.'):
+                    self.add(filename)
+            elif filename.endswith('.py') or filename in self.extra:
+                changed.add(filename)
+        return changed
+
+def make_watcher(folders, extra=(), polling=False):
+    if inotify_simple is not None and not polling:
+        try:
+            return InotifyWatcher(folders, extra)
+        except OSError as e:
+            print(f'inotify not available, polling: {e}', file=sys.stderr)
+    return PollingWatcher(folders, extra)
+
+def debounced(watcher, delay:'seconds without a change before reporting'=0.3):
+    """Generate sets of changed files, each when no more changes arrive for `delay` seconds"""
+    while True:
+        changed = watcher.poll(3600)
+        while changed:
+            more = watcher.poll(delay)
+            if not more: break
+            changed |= more
+        if changed:
+            yield changed
+
+def document_inputs(docman, docname,
+                    parsed:'dict, file: imported names, see manifest.imported_files'=None,
+                   )->'set of the files that the document depends on':
+    from .manifest import manifest_name, dependency_files
+    module_name = docman.lookup_module.get(docname.split('.')[0])
+    files = set(dependency_files(module_name, parsed)) if module_name else set()
+    try:
+        with open(os.path.join(docman.document_folder(docname), manifest_name), 'r') as inp:
+            files.update(json.load(inp)['depends'])
+    except (OSError, ValueError, KeyError):
+        pass
+    return files
+
+def outside_sections_hash(filename)->'hash of the module, except the section functions of its classes, or None':
+    # the section cache key covers the source of each section function, but not the rest of the module
+    import ast, yaml
+    try:
+        with open(filename, 'rb') as inp:
+            tree = ast.parse(inp.read())
+    except (OSError, SyntaxError, ValueError):
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.ClassDef): continue
+        try:
+            info = yaml.safe_load(ast.get_docstring(node) or '')
+        except Exception:
+            continue
+        sections = info.get('sections', '') if isinstance(info, dict) else ''
+        names = set(re.findall(r'[A-Za-z_]\w*', str(sections)))
+        node.body = [f for f in node.body 
+                if not (isinstance(f, (ast.FunctionDef, ast.AsyncFunctionDef)) and f.name in names)]
+    return hashlib.sha1(ast.dump(tree).encode('utf8')).hexdigest()
+
+def module_hashes(docman)->'dict, file: outside_sections_hash, for the modules of the documents':
+    from .manifest import module_file
+    files = set(module_file(docman.lookup_module[name]) for name in docman.doc_classes if name!='Index')
+    return dict((fn, outside_sections_hash(fn)) for fn in files if fn)
+
+def affected_documents(docman, changed:'set of file names',
+                       parsed:'dict, file: imported names, with the changed files already removed'=None,
+                       hashes:'dict from module_hashes, made before the change, and updated here'=None,
+                      )->'(documents with only section functions changed, documents with other inputs changed)':
+    # only the first can replay the sections whose code did not change
+    from .manifest import module_file
+    changed = set(os.path.abspath(fn) for fn in changed)
+    hashes = {} if hashes is None else hashes
+    new = dict((fn, outside_sections_hash(fn)) for fn in changed if fn.endswith('.py'))
+    own, other = [], []
+    for name in sorted(docman.doc_classes):
+        if name=='Index': continue
+        hit = document_inputs(docman, name, parsed) & changed
+        if not hit: continue
+        fn = module_file(docman.lookup_module[name])
+        only_sections = hit=={fn} and new.get(fn) is not None and hashes.get(fn)==new[fn]
+        (own if only_sections else other).append(name)
+    hashes.update(new)
+    return own, other
+
+def invalidate(docman, changed, docnames):
+    """Before building in this process, or in workers forked from it: reload the changed modules that are
+    not documents, then make sure that the modules of the documents will be reloaded, since they may
+    import from them"""
+    from . import docman as docman_module
+    changed = set(os.path.abspath(fn) for fn in changed)
+    doc_modules = set(docman.lookup_module.get(name) for name in docnames)
+    for name, module in list(sys.modules.items()):
+        fn = getattr(module, '__file__', None)
+        if fn and os.path.abspath(fn) in changed and name not in docman_module.loaded:
+            try:
+                importlib.reload(module)
+            except Exception as e:
+                print(f'Failed to reload {name}: {e.__class__.__name__}: {e}', file=sys.stderr)
+    for name in doc_modules:
+        docman_module.loaded.pop(name, None)
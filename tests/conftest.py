@@ -0,0 +1,55 @@
+import os, sys, textwrap
+import pytest
+
+os.environ.setdefault('MPLBACKEND', 'Agg')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def make_package(tmp_path, monkeypatch):
+    """Return a function that writes a package, from a dict of relative file name: source,
+    under tmp_path/src, and puts it on sys.path. The jupydoc cache goes to tmp_path/cache.
+    """
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path/'cache'))
+    src = tmp_path/'src'
+    monkeypatch.syspath_prepend(str(src))
+    made = []
+
+    def make(files):
+        for name, text in files.items():
+            filename = src/name
+            filename.parent.mkdir(parents=True, exist_ok=True)
+            filename.write_text(textwrap.dedent(text))
+            made.append(name.split('/')[0].replace('.py', ''))
+        return src
+
+    yield make
+    for name in list(sys.modules):
+        if name.split('.')[0] in made:
+            del sys.modules[name]
+    from jupydoc import docman
+    docman.loaded.clear()
+
+@pytest.fixture
+def build_doc(make_package, tmp_path, monkeypatch):
+    """Return a function that writes, or rewrites, the module "tdoc_<name>" with a document class
+    named T and the given body, then builds it to tmp_path/docs/T, and returns the doc object
+    """
+    import importlib
+    sys.dont_write_bytecode = True
+    monkeypatch.chdir(tmp_path)
+    docs = tmp_path/'docs'
+    docs.mkdir()
+
+    def build(source, name='a', docname='T', call={}, **kwargs):
+        module_name = f'tdoc_{name}'
+        make_package({module_name+'.py': source})
+        importlib.invalidate_caches()
+        module = sys.modules.get(module_name)
+        module = importlib.reload(module) if module else importlib.import_module(module_name)
+        doc = module.T(docpath=str(docs), docname=docname, no_display=True, **kwargs)
+        doc(**call)
+        return doc
+    return build
+
+def page(tmp_path, docname='T'):
+    return (tmp_path/'docs'/docname/'index.html').read_text()
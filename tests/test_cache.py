@@ -0,0 +1,52 @@
+import json
+from pathlib import Path
+from conftest import page
+from jupydoc.store import cache_path
+
+source = '''
+    from jupydoc import DocPublisher
+    class T(DocPublisher):
+        """
+        title: Test
+        sections: one two
+        """
+        def one(self):
+            """{heading}
+
+            x is {x}
+            """
+            x = 42
+            self.publishme()
+        def two(self):
+            """Two
+            """
+            self.publishme()
+    '''
+
+def test_replay(build_doc, tmp_path):
+    build_doc(source.replace('{heading}', 'One'), call=dict(use_cache=True))
+    first = page(tmp_path)
+    assert 'x is 42' in first
+    build_doc(source.replace('{heading}', 'One'), call=dict(use_cache=True))
+    assert page(tmp_path).count('x is 42')==1
+
+def test_docstring_change_is_rerendered(build_doc, tmp_path):
+    build_doc(source.replace('{heading}', 'One'), call=dict(use_cache=True))
+    build_doc(source.replace('{heading}', 'Uno'), call=dict(use_cache=True))
+    text = page(tmp_path)
+    assert 'Uno' in text and 'x is 42' in text
+
+def test_record_without_code_key(build_doc, tmp_path):
+    # a record saved before code_key was added
+    build_doc(source.replace('{heading}', 'One'), call=dict(use_cache=True))
+    for filename in Path(cache_path('sections', str(tmp_path/'docs')), 'T').glob('*.json'):
+        record = json.loads(filename.read_text())
+        del record['code_key']
+        filename.write_text(json.dumps(record))
+    build_doc(source.replace('{heading}', 'Uno'), call=dict(use_cache=True))
+    assert 'Uno' in page(tmp_path)
+
+def test_cache_per_docs_folder(build_doc, tmp_path):
+    build_doc(source.replace('{heading}', 'One'), call=dict(use_cache=True))
+    assert not (tmp_path/'.jupydoc_cache').exists()
+    assert (Path(cache_path('sections', str(tmp_path/'docs')))/'T').is_dir()
@@ -0,0 +1,57 @@
+from jupydoc import __main__ as cli
+
+doc_module = '''
+    from jupydoc import DocPublisher
+    __docs__ = ['{name}']
+    class {name}(DocPublisher):
+        """
+        title: {name}
+        sections: one
+        """
+        def one(self):
+            """{text}
+            """
+            {code}
+            self.publishme()
+    '''
+
+def make_docs(make_package, tmp_path, b_code='pass'):
+    (tmp_path/'docs').mkdir()
+    make_package({
+        'cpk/__init__.py': f'docspath = "{tmp_path}/docs"\n',
+        'cpk/a.py': doc_module.format(name='A', text='Text of A', code='pass'),
+        'cpk/b.py': doc_module.format(name='B', text='Text of B', code=b_code),
+        })
+
+def test_build(make_package, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    make_docs(make_package, tmp_path)
+    assert cli.main(['build', 'cpk'])==0
+    assert 'Text of A' in (tmp_path/'docs'/'A'/'index.html').read_text()
+    assert 'B' in (tmp_path/'docs'/'index.html').read_text()
+    assert cli.main(['build', 'cpk', '--changed'])==0
+    assert 'All 2 documents are up to date' in capsys.readouterr().out
+
+def test_build_failure_and_repeats(make_package, tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    make_docs(make_package, tmp_path, b_code='1/0')
+    # a name given twice, with one failure, does not break the summary
+    assert not cli.build('cpk', ['A', 'B', 'A'])
+    out, err = capsys.readouterr()
+    assert 'Building 2 documents' in out
+    assert '1 of 2 documents failed: B' in err
+
+def test_package_not_found(make_package, capsys):
+    assert cli.main(['build', 'no_such_package'])==1
+    assert cli.watch('no_such_package') is False
+
+def test_build_runs_gc_once(make_package, tmp_path, monkeypatch):
+    from jupydoc.store import ContentStore
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ContentStore, 'auto_gc', True)
+    calls = []
+    monkeypatch.setattr(ContentStore, 'maybe_gc', lambda self, *args: calls.append('save'))
+    monkeypatch.setattr(ContentStore, 'gc', lambda self, *args: calls.append('build'))
+    make_docs(make_package, tmp_path)
+    assert cli.build('cpk')
+    assert 'save' not in calls and 'build' in calls
@@ -0,0 +1,55 @@
+import io, os, sys, time, textwrap, subprocess
+import pytest
+from jupydoc import DocMan
+from jupydoc import __main__ as cli
+from jupydoc.daemon import request
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs fork')
+
+doc_module = '''
+    from jupydoc import DocPublisher
+    __docs__ = ['A']
+    class A(DocPublisher):
+        """
+        title: A
+        sections: one
+        """
+        def one(self):
+            """Text of A
+            """
+            self.publishme()
+    '''
+
+def test_build_reuses_docman(make_package, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/'out').mkdir()
+    make_package({'dmpk/__init__.py': '', 'dmpk/a.py': doc_module})
+    dm = DocMan('dmpk', docspath=str(tmp_path/'out'))
+    def fail(*args): raise AssertionError('a new DocMan was made')
+    monkeypatch.setattr(cli, '_init_worker', fail)
+    assert cli.build('dmpk', docman=dm)
+    assert 'Text of A' in (tmp_path/'out'/'A'/'index.html').read_text()
+
+def test_daemon_docspath(make_package, tmp_path):
+    # a package without docspath: the daemon's is used
+    (tmp_path/'out').mkdir()
+    src = make_package({'dmpk/__init__.py': '', 'dmpk/a.py': doc_module})
+    sock = str(tmp_path/'d.sock')
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([str(src), os.path.dirname(os.path.dirname(cli.__file__))]))
+    daemon = subprocess.Popen([sys.executable, '-m', 'jupydoc', 'daemon', 'dmpk', '--docspath', str(tmp_path/'out'),
+                '--socket', sock], env=env, cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        for _ in range(300):
+            if os.path.exists(sock): break
+            time.sleep(0.1)
+        out = io.BytesIO()
+        assert request('dmpk', args=dict(docnames=['A']), path=sock, out=out)==0, out.getvalue().decode()
+        assert 'Text of A' in (tmp_path/'out'/'A'/'index.html').read_text()
+        # a document added since the daemon started
+        (src/'dmpk'/'b.py').write_text(textwrap.dedent(doc_module.replace('A', 'B')))
+        assert request('dmpk', args=dict(docnames=[]), path=sock, out=out)==0, out.getvalue().decode()
+        assert 'Text of B' in (tmp_path/'out'/'B'/'index.html').read_text()
+        assert request('dmpk', 'stop', path=sock, out=io.BytesIO())==0
+        daemon.wait(10)
+    finally:
+        daemon.kill()
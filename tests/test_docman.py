@@ -0,0 +1,95 @@
+from jupydoc import DocMan
+from jupydoc import docman as docman_module
+
+doc_module = '''
+    from jupydoc import DocPublisher
+    __docs__ = ['{name}']
+    class {name}(DocPublisher):
+        """
+        title: {name}
+        sections: one
+        """
+        def one(self):
+            """One
+            """
+            self.publishme()
+    '''
+
+def test_discovery(make_package, tmp_path):
+    make_package({
+        'dpk/__init__.py': f'docspath = "{tmp_path}/docs"\n',
+        'dpk/a.py': doc_module.format(name='A'),
+        'dpk/sub/__init__.py': '',
+        'dpk/sub/b.py': doc_module.format(name='B'),
+        'dpk/plain.py': 'x = 1\n',
+        })
+    dm = DocMan('dpk')
+    assert sorted(dm.doc_classes)==['A', 'B']
+    assert dm.lookup_module['B']=='dpk.sub.b'
+    assert dm.docspath==f'{tmp_path}/docs'
+    # discovery does not import the document modules
+    import sys
+    assert 'dpk.a' not in sys.modules
+
+def test_packages_str():
+    p = docman_module.Packages()
+    p['pkg'] = '/docs'
+    assert str(p)=='Packages:\n   pkg'
+    assert repr(p)==str(p)
+
+def test_failed_package_is_skipped(make_package, tmp_path):
+    make_package({
+        'fpk/__init__.py': f'docspath = "{tmp_path}/docs"\n',
+        'fpk/a.py': doc_module.format(name='A'),
+        # dynamic docspath: must be imported, and fails
+        'fpk/bad/__init__.py': 'import no_such_module\ndocspath = no_such_module.path\n',
+        'fpk/bad/b.py': doc_module.format(name='B'),
+        # in the subtree of the failed package
+        'fpk/bad/deep/__init__.py': '',
+        'fpk/bad/deep/c.py': doc_module.format(name='C'),
+        # not imported, but does not compile
+        'fpk/broken/__init__.py': 'def (:\n',
+        'fpk/broken/d.py': doc_module.format(name='D'),
+        })
+    dm = DocMan('fpk')
+    assert dm.doc_classes==['A']
+
+def test_reload_only_changed(make_package, monkeypatch):
+    import os, sys
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    src = make_package({
+        'rpk/__init__.py': '',
+        'rpk/a.py': 'loads = []\nVALUE = 1\n',
+        'rpk/b.py': '__depends__ = [".helper", "data.txt"]\nfrom .helper import VALUE\nloads = []\n',
+        'rpk/helper.py': 'VALUE = 1\n',
+        'rpk/data.txt': 'x',
+        'rpk/c.py': '__depends__ = [".d"]\nloads = []\n',
+        'rpk/d.py': '__depends__ = [".c"]\nVALUE = 1\n',
+        })/'rpk'
+    def load(name):
+        module = docman_module.import_module(name)
+        module.loads.append(1)
+        return module
+    def touch(fn, text=None):
+        if text is not None: fn.write_text(text)
+        st = fn.stat()
+        os.utime(fn, ns=(st.st_atime_ns, st.st_mtime_ns+10**9))
+
+    a = load('rpk.a')
+    assert load('rpk.a').loads==[1, 1] # not reloaded
+    touch(src/'a.py')
+    assert load('rpk.a').loads==[1, 1, 1] # only touched
+    touch(src/'a.py', 'loads = []\nVALUE = 22\n')
+    assert load('rpk.a').loads==[1] and a.VALUE==22
+
+    b = load('rpk.b')
+    touch(src/'data.txt', 'y')
+    assert load('rpk.b').loads==[1] # a file in __depends__
+    touch(src/'helper.py', 'VALUE = 22\n')
+    assert load('rpk.b').loads==[1] and b.VALUE==22 # a module, by relative name
+
+    # a cycle: c and d depend on each other
+    c = load('rpk.c')
+    assert load('rpk.c').loads==[1, 1]
+    touch(src/'d.py', '__depends__ = [".c"]\nVALUE = 22\n')
+    assert load('rpk.c').loads==[1] and sys.modules['rpk.d'].VALUE==22
@@ -0,0 +1,52 @@
+import os, sys
+from jupydoc import DocMan
+from jupydoc import __main__ as cli
+from jupydoc.manifest import imported_files, module_file, stale_reason
+
+doc_module = '''
+    from jupydoc import DocPublisher
+    from .helper import VALUE
+    __docs__ = ['A']
+    class A(DocPublisher):
+        """
+        title: A
+        sections: one
+        """
+        def one(self):
+            """One {VALUE}
+            """
+            self.publishme()
+    '''
+
+def make(make_package, tmp_path):
+    (tmp_path/'docs').mkdir()
+    return make_package({
+        'mpk/__init__.py': f'docspath = "{tmp_path}/docs"\n',
+        'mpk/sub/__init__.py': 'raise RuntimeError("imported")\n',
+        'mpk/sub/helper.py': 'VALUE = 1\n',
+        'mpk/sub/a.py': doc_module,
+        'mpk/other.py': 'import os\n',
+        })
+
+def test_imported_files_does_not_import(make_package, tmp_path):
+    src = make(make_package, tmp_path)
+    found = imported_files('mpk.sub.a')
+    assert sorted(found)==['mpk', 'mpk.sub', 'mpk.sub.a', 'mpk.sub.helper']
+    assert found['mpk.sub.helper']==str(src/'mpk'/'sub'/'helper.py')
+    assert not [name for name in sys.modules if name.startswith('mpk')]
+    assert module_file('mpk.missing') is None and module_file('no_such_package') is None
+
+def test_stale_reason(make_package, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    src = make(make_package, tmp_path)
+    (src/'mpk'/'sub'/'__init__.py').write_text('')
+    dm = DocMan('mpk')
+    assert stale_reason(dm, 'A')=='no manifest'
+    assert cli.build('mpk')
+    assert stale_reason(dm, 'A')==''
+    (src/'mpk'/'sub'/'helper.py').write_text('VALUE = 2\n')
+    assert stale_reason(dm, 'A').startswith('dependency')
+    assert cli.build('mpk')
+    with open(tmp_path/'docs'/'A'/'index.html', 'a') as out:
+        out.write('edited')
+    assert stale_reason(dm, 'A')=='output index.html changed or missing'
@@ -0,0 +1,101 @@
+import re
+import pytest
+from conftest import page
+from jupydoc.docpub import renumber_figures
+
+pytest.importorskip('matplotlib')
+
+source = '''
+    import matplotlib.pyplot as plt
+    from jupydoc import DocPublisher
+    class T(DocPublisher):
+        """
+        title: Test
+        sections: one two
+        """
+        def one(self):
+            """One
+
+            {fig}
+            """
+            fig, ax = plt.subplots(figsize=(2,1))
+            fig.caption = 'first'
+            self.publishme()
+        def two(self):
+            """Two
+
+            As <b>Figure 7</b> of the paper shows: {fig}
+            """
+            fig, ax = plt.subplots(figsize=(2,1))
+            fig.caption = 'second'
+            self.publishme()
+    '''
+
+def test_renumber_only_generated():
+    text = '<b class="jupydoc_fignum">Figure 1</b>. caption, and <b>Figure 1</b> by the user, alt="Figure 1"'
+    assert renumber_figures(text, 2)==\
+        '<b class="jupydoc_fignum">Figure 3</b>. caption, and <b>Figure 1</b> by the user, alt="Figure 1"'
+    img = '<img class="jupydoc_fignum" src="images/two_fig_01.png" alt="Figure 1 at images/two_fig_01.png" >'
+    assert 'alt="Figure 4 at' in renumber_figures(img, 3)
+
+def test_parallel_matches_serial(build_doc, tmp_path):
+    # parallel workers prefix the figure file names with the section name
+    def strip(text): return re.sub(r'20\d\d-[\d-]+ [\d:]+|images/\w*fig_\d+.png', '', text)
+    build_doc(source)
+    serial = strip(page(tmp_path))
+    build_doc(source, call=dict(parallel=2))
+    parallel = strip(page(tmp_path))
+    assert 'Figure 2</b>. second' in serial
+    assert '<b>Figure 7</b> of the paper' in parallel
+    assert parallel==serial
+
+selected_source = '''
+    import matplotlib.pyplot as plt
+    from jupydoc import DocPublisher
+    class T(DocPublisher):
+        """
+        title: Test
+        sections: one two
+        """
+        def one(self):
+            """One
+
+            {{fig1}} {{fig2}}
+            """
+            fig1, ax = plt.subplots(figsize=(2,1))
+            fig1.caption = 'one'
+            fig2 = ''
+            if {nfigs}>1:
+                fig2, ax = plt.subplots(figsize=(2,1))
+                fig2.caption = 'also one'
+            self.publishme()
+        def two(self):
+            """Two
+
+            {{fig}}
+            """
+            fig, ax = plt.subplots(figsize=(2,1))
+            fig.caption = 'second'
+            self.publishme()
+    '''
+
+def test_selected_only_renumbers_replay(build_doc, tmp_path):
+    build_doc(selected_source.format(nfigs=1), call=dict(use_cache=True))
+    assert 'Figure 2</b>. second' in page(tmp_path)
+    # one now has two figures: two, replayed, must follow them
+    build_doc(selected_source.format(nfigs=2), call=dict(examine=1, selected_only=True))
+    text = page(tmp_path)
+    assert 'Figure 3</b>. second' in text
+    files = re.findall(r'src="([^"]*fig_\d+\.png)"', text)
+    assert len(files)==3 and len(set(files))==3
+    assert (tmp_path/'docs'/'T'/files[-1]).is_file()
+
+def test_parallel_figures_identical(build_doc, tmp_path):
+    def pngs():
+        folder = tmp_path/'docs'/'T'/'images'
+        return sorted(fn.read_bytes() for fn in folder.glob('*.png'))
+    build_doc(source)
+    serial = pngs()
+    for fn in (tmp_path/'docs'/'T'/'images').glob('*.png'): fn.unlink()
+    build_doc(source, call=dict(parallel=2))
+    assert len(serial)==2 and pngs()==serial
@@ -0,0 +1,52 @@
+import urllib.request
+from jupydoc import docpub, renderers
+from jupydoc.server import start_server, events_path
+
+source = '''
+    from jupydoc import DocPublisher
+    class T(DocPublisher):
+        """
+        title: Test
+        sections: one two
+        """
+        def one(self):
+            """One
+            """
+            self.publishme()
+        def two(self):
+            """Two
+            """
+            self.publishme()
+    '''
+
+def test_section_events(build_doc, monkeypatch):
+    events = []
+    monkeypatch.setattr(docpub, 'build_listeners', [lambda doc, event, **info: events.append((event, info))])
+    rendered = []
+    cell = renderers.MarkdownRenderer.cell
+    def spy(self, text):
+        rendered.append(text)
+        return cell(self, text)
+    monkeypatch.setattr(renderers.MarkdownRenderer, 'cell', spy)
+    build_doc(source, stream=True)
+    sections = [info for event, info in events if event=='section']
+    assert [s['function'] for s in sections]==['title_page', 'one', 'two']
+    assert 'One' in sections[1]['html'] and 'Two' not in sections[1]['html']
+    # each cell is converted once, by the spool
+    assert len(rendered)==len(set(rendered))
+    assert events[-1][0]=='done' and events[-1][1]['saved']
+
+def test_server_headers(tmp_path):
+    (tmp_path/'A').mkdir()
+    (tmp_path/'A'/'index.html').write_text('<html><body>A</body></html>')
+    (tmp_path/'A'/'x.png').write_bytes(b'png')
+    server, broadcaster = start_server(str(tmp_path), 0)
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}'
+        for path in ['/A/', '/A/index.html', '/A/x.png']:
+            with urllib.request.urlopen(url+path) as response:
+                assert response.headers.get_all('Cache-Control')==['no-cache'], path
+                body = response.read()
+            assert (events_path.encode() in body)==(path!='/A/x.png')
+    finally:
+        server.shutdown()
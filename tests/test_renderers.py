@@ -0,0 +1,53 @@
+import re
+import pytest
+from jupydoc import renderers
+from jupydoc.renderers import Renderer, MarkdownRenderer, FragmentCache
+
+pytest.importorskip('mistune')
+
+cells = ['## Hello $x$ world', '<h2></h2>', '<a id="title_page"><h1>T</h1></a>', '# A *b*',
+         'text with $a<b$ and\n\n$$\\sum_i x_i$$', '| a | b |\n|---|---|\n| 1 | 2 |']
+
+def headings(text):
+    return re.findall(r'<h[1-6][^>]*>.*?</h[1-6]>', text)
+
+def test_markdown_headings_only():
+    out = MarkdownRenderer().page(cells, 'test')
+    assert headings(out)==[
+        '<h2 id="Hello-$x$-world">Hello $x$ world<a class="anchor-link" href="#Hello-$x$-world">¶</a></h2>',
+        '<h2></h2>',
+        '<h1>T</h1>',
+        '<h1 id="A-b">A <em>b</em><a class="anchor-link" href="#A-b">¶</a></h1>',
+        ]
+    assert renderers.heading_mark not in out
+
+def test_nbconvert_parity():
+    pytest.importorskip('nbconvert')
+    nb = renderers.NbconvertRenderer().page(cells, 'test')
+    md = MarkdownRenderer().page(cells, 'test')
+    assert headings(md)==headings(nb)
+    assert '$a&lt;b$' in md and '$a&lt;b$' in nb
+
+def test_default_cell():
+    class Plain(Renderer):
+        name = 'plain'
+    assert '<pre>a &lt; b</pre>' in Plain().cell('a < b')
+
+def test_fragment_cache(tmp_path):
+    r = MarkdownRenderer()
+    fragments = FragmentCache(str(tmp_path))
+    assert r.page(cells, 't', fragments=fragments)==r.page(cells, 't')
+    assert len(list(tmp_path.glob('*.html')))==len(cells)
+    fragments = FragmentCache(str(tmp_path))
+    r.page(cells[:2], 't', fragments=fragments)
+    fragments.prune()
+    assert len(list(tmp_path.glob('*.html')))==2
+
+def test_fragment_version(tmp_path, monkeypatch):
+    from jupydoc import manifest
+    r = MarkdownRenderer()
+    r.page(cells[:1], 't', fragments=FragmentCache(str(tmp_path)))
+    # the renderer code changed: the old fragment is not used
+    monkeypatch.setattr(manifest, 'jupydoc_hash', lambda: 'new')
+    monkeypatch.setattr(MarkdownRenderer, 'cell', lambda self, text: 'new output')
+    assert 'new output' in r.page(cells[:1], 't', fragments=FragmentCache(str(tmp_path)))
@@ -0,0 +1,133 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip('pandas')
+from jupydoc.replacer import ObjectReplacer, format_floats
+
+def test_format_floats_spec():
+    df = pd.DataFrame(dict(x=[1234.5678, np.nan, -0.5], n=[1, 2, 3]))
+    out = format_floats(df, ',.2f')
+    assert list(out.x)==['1,234.57', 'NaN', '-0.50']
+    assert list(out.n)==[1, 2, 3]
+    assert list(format_floats(df, '.1e', na_rep='-').x)==['1.2e+03', '-', '-5.0e-01']
+
+def wrap(obj, **options):
+    replacer = ObjectReplacer()
+    if options:
+        wrapper, kwargs = replacer.wrapper_for(obj)
+        replacer.register(type(obj), wrapper, **dict(kwargs, **options))
+    vars = dict(obj=obj)
+    replacer(vars)
+    return vars['obj']
+
+def test_dataframe_spec_and_preview():
+    df = pd.DataFrame(dict(x=np.arange(100)*1000.5))
+    html = str(wrap(df, float_format=',.1f', max_rows=6, sidecar_rows=None))
+    assert '1,000.5' in html and '...' in html
+    assert '99,049.5' in html # the last row
+
+def test_invalid_spec(capsys):
+    df = pd.DataFrame(dict(x=[1.5]))
+    html = str(wrap(df, float_format='%.2f', sidecar_rows=None))
+    assert 'ignoring float_format' in capsys.readouterr().err
+    assert '1.5' in html
+
+def test_pp_total_budget():
+    from jupydoc.replacer import budgeted
+    nested = [[[list(range(100))]*100]*100]*100 # 1e8 leaves
+    obj, cut = budgeted(nested, 6, 100, 50)
+    assert cut
+    def count(x): return 1+sum(count(v) for v in x) if isinstance(x, list) else 1
+    assert count(obj) < 100
+    # within budget, nothing is cut
+    assert budgeted(dict(a=[1, 2], b=3), 6, 100, 50)==(dict(a=[1, 2], b=3), False)
+
+def test_pp_wrapper_bounded():
+    import time
+    nested = {i: {j: list(range(100)) for j in range(100)} for i in range(100)}
+    t = time.time()
+    html = str(wrap(nested))
+    assert time.time()-t < 1
+    assert 'dict: 100 keys of int; abbreviated' in html
+
+def test_array_stats():
+    from jupydoc.replacer import array_stats
+    a = np.arange(1000.)
+    a[0] = np.nan
+    exact = array_stats(a, chunk_size=100)
+    approx = array_stats(a, chunk_size=100, exact_size=10)
+    assert exact['nan']==1 and exact['count']==999 and exact['min']==1
+    assert abs(approx['quantiles'][0.5]-exact['quantiles'][0.5]) < 2
+    assert 'histogram' not in exact and 'histogram' in array_stats(a, histogram=True)
+    assert 'quantiles' not in array_stats(a, quantiles=())
+
+def test_bool_memmap_in_chunks(tmp_path, monkeypatch):
+    from jupydoc import replacer
+    m = np.lib.format.open_memmap(str(tmp_path/'b.npy'), mode='w+', dtype=bool, shape=(10_000,))
+    m[::4] = True
+    largest = []
+    chunks = replacer.array_chunks
+    def spy(arr, chunk_size):
+        for c in chunks(arr, chunk_size):
+            largest.append(c.nbytes)
+            yield c
+    monkeypatch.setattr(replacer, 'array_chunks', spy)
+    html = str(wrap(m, chunk_size=1000))
+    assert max(largest) <= 1000
+    assert '<td>0.25</td>' in html # the mean
+
+def test_registry_subclasses():
+    import collections
+    from jupydoc.replacer import PPWrapper, Wrapper
+    replacer = ObjectReplacer()
+    assert replacer.wrapper_for(collections.OrderedDict())[0] is PPWrapper
+    assert replacer.wrapper_for(3) is None
+    # the per-type cache is cleared by a registration
+    replacer.register(collections.OrderedDict, Wrapper)
+    assert replacer.wrapper_for(collections.OrderedDict())[0] is Wrapper
+    assert replacer.wrapper_for({})[0] is PPWrapper
+
+def test_dict_subclass_fields():
+    class Params(dict):
+        name = 'run 1'
+    vars = dict(p=Params(a=1), d=dict(b=2))
+    ObjectReplacer()(vars)
+    assert '{p.name}, {d[b]}, {p[a]:>3}'.format(**vars)=='run 1, 2,   1'
+    assert "{'a': 1}" in '{p}'.format(**vars)
+
+def test_table_cache_reuse(tmp_path, monkeypatch):
+    from jupydoc import replacer as replacer_module
+    monkeypatch.setattr(replacer_module, 'table_cache', replacer_module.TableCache())
+    renders = []
+    render = replacer_module.DataFrameWrapper._render
+    monkeypatch.setattr(replacer_module.DataFrameWrapper, '_render', 
+        lambda self: renders.append(1) or render(self))
+    def page(folder, df):
+        replacer = ObjectReplacer(folders=[str(tmp_path/folder)])
+        vars = dict(df=df)
+        replacer(vars)
+        return str(vars['df']), replacer.files
+    df = pd.DataFrame(dict(x=np.arange(2000)*0.5))
+    html, files = page('A', df)
+    assert len(files)==1 and (tmp_path/'A'/files[0]).is_file()
+    # an equal table, in the same and in another document
+    assert page('A', df.copy())==(html, files)
+    assert page('B', df.copy())==(html, files)
+    assert (tmp_path/'B'/files[0]).read_bytes()==(tmp_path/'A'/files[0]).read_bytes()
+    assert len(renders)==1
+    # the file is gone: rendered again
+    (tmp_path/'A'/files[0]).unlink()
+    (tmp_path/'B'/files[0]).unlink()
+    page('C', df)
+    assert len(renders)==2 and (tmp_path/'C'/files[0]).is_file()
+
+def test_table_cache_eviction():
+    from jupydoc.replacer import TableCache
+    cache = TableCache(max_size=10)
+    cache.put('a', 'x'*4)
+    cache.put('b', 'x'*4)
+    cache.get('a') # now the most recent
+    cache.put('c', 'x'*4)
+    assert list(cache.entries)==['a', 'c'] and cache.size==8
+    cache.put('d', 'x'*11) # too big to keep
+    assert cache.get('d') is None and cache.size==8
@@ -0,0 +1,67 @@
+import os
+from conftest import page
+from jupydoc.store import ContentStore, write_if_changed, cache_path
+
+def test_write_if_changed(tmp_path):
+    fn = str(tmp_path/'a'/'f.txt')
+    assert write_if_changed(fn, b'one')
+    os.utime(fn, (1, 1))
+    assert not write_if_changed(fn, b'one')
+    assert os.path.getmtime(fn)==1
+    assert write_if_changed(fn, b'two')
+
+def test_install_links_and_gc(tmp_path):
+    store = ContentStore(str(tmp_path/'store'))
+    a, b = str(tmp_path/'docs'/'A'/'x.png'), str(tmp_path/'docs'/'B'/'x.png')
+    assert store.install(b'data', a)
+    assert store.install(b'data', b)
+    assert not store.install(b'data', a)
+    assert os.path.samefile(a, b)
+    assert store.gc()==0
+    # changing a link does not change the blob, or the other link
+    write_if_changed(a, b'new')
+    assert open(b, 'rb').read()==b'data'
+    os.remove(b)
+    assert store.gc()==0 # too new: it may be about to be linked
+    assert store.gc(grace=0)==1
+
+def test_maybe_gc(tmp_path):
+    store = ContentStore(str(tmp_path/'store'))
+    assert store.maybe_gc()==0
+    store.install(b'data', str(tmp_path/'x.png'))
+    os.utime(store.blob(b'data', '.png'), (1, 1))
+    os.remove(str(tmp_path/'x.png'))
+    assert store.maybe_gc() is None # too soon
+    assert store.maybe_gc(interval=0)==1
+
+def test_gc_keeps_files_being_written(tmp_path):
+    store = ContentStore(str(tmp_path/'store'))
+    blob = store.blob(b'data')
+    tmp = os.path.join(os.path.dirname(blob), '.tmpabc')
+    open(tmp, 'wb').close()
+    for fn in (blob, tmp): os.utime(fn, (1, 1))
+    assert store.gc()==1
+    assert os.path.exists(tmp) and not os.path.exists(blob)
+
+source = '''
+    from jupydoc import DocPublisher
+    class T(DocPublisher):
+        """
+        title: Test
+        sections: one
+        """
+        def one(self):
+            """One
+            """
+            self.publishme()
+    '''
+
+def test_caches_outside_docs(build_doc, tmp_path):
+    (tmp_path/'docs'/'.jupydoc_store').mkdir() # from an older version
+    build_doc(source, stream=True)
+    build_doc(source)
+    assert 'One' in page(tmp_path)
+    hidden = [name for _, dirs, files in os.walk(tmp_path/'docs') for name in dirs+files if name.startswith('.')]
+    assert hidden==[]
+    assert os.path.isdir(cache_path('fragments', str(tmp_path/'docs'/'T')))
+    assert cache_path('store', str(tmp_path/'docs')).startswith(str(tmp_path/'cache'))
@@ -0,0 +1,113 @@
+import os, sys, textwrap
+from jupydoc import DocMan, manifest
+from jupydoc import __main__ as cli
+from jupydoc.watcher import PollingWatcher, debounced, affected_documents, invalidate, module_hashes
+
+doc_module = '''
+    from jupydoc import DocPublisher
+    {imports}
+    __docs__ = ['{name}']
+    class {name}(DocPublisher):
+        """
+        title: {name}
+        sections: one
+        """
+        def one(self):
+            """One {{VALUE}}
+            """
+            VALUE = {value}
+            self.publishme()
+    '''
+
+def make(make_package, tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/'docs').mkdir()
+    return make_package({
+        'wpk/__init__.py': f'docspath = "{tmp_path}/docs"\n',
+        'wpk/helper.py': 'VALUE = 1\n',
+        'wpk/a.py': doc_module.format(name='A', imports='from . import helper', value='helper.VALUE'),
+        'wpk/b.py': doc_module.format(name='B', imports='', value='0'),
+        })/'wpk'
+
+def test_debounced(tmp_path):
+    fn = tmp_path/'m.py'
+    fn.write_text('x = 1\n')
+    watcher = PollingWatcher([str(tmp_path)], interval=0.01)
+    fn.write_text('x = 22\n')
+    assert next(debounced(watcher, 0.05))=={str(fn)}
+
+def test_affected_documents(make_package, tmp_path, monkeypatch):
+    src = make(make_package, tmp_path, monkeypatch)
+    dm = DocMan('wpk')
+    parses = []
+    imported_names = manifest.imported_names
+    def spy(filename, parent):
+        parses.append(filename)
+        return imported_names(filename, parent)
+    monkeypatch.setattr(manifest, 'imported_names', spy)
+    parsed, hashes = {}, module_hashes(dm)
+    assert affected_documents(dm, {str(src/'helper.py')}, parsed, hashes)==([], ['A'])
+    assert affected_documents(dm, {str(src/'a.py')}, parsed, hashes)==(['A'], [])
+    assert len(parses)==len(set(parses)) # each file parsed once
+    # a new import is seen once the changed file is dropped from the cache
+    (src/'b.py').write_text(textwrap.dedent(doc_module.format(name='B', imports='from . import helper', value='0')))
+    parsed.pop(str(src/'b.py'))
+    assert affected_documents(dm, {str(src/'helper.py')}, parsed)==([], ['A', 'B'])
+
+def test_parallel_sees_reloaded_module(make_package, tmp_path, monkeypatch):
+    src = make(make_package, tmp_path, monkeypatch)
+    import wpk.helper # as if imported by an earlier build in this process
+    (src/'helper.py').write_text('VALUE = 22\n')
+    dm = DocMan('wpk')
+    invalidate(dm, {str(src/'helper.py')}, ['A'])
+    assert cli.build('wpk', ['A'], jobs=2)
+    assert 'One 22' in (tmp_path/'docs'/'A'/'index.html').read_text()
+
+scaled = '''
+    from jupydoc import DocPublisher
+    SCALE = {scale}
+    __docs__ = ['S']
+    class S(DocPublisher):
+        """
+        title: S
+        sections: one
+        """
+        def helper(self):
+            return {factor}*SCALE
+        def one(self):
+            """Value {{value}}
+            """
+            value = self.helper()
+            self.publishme()
+    '''
+
+def test_watch_module_change_outside_sections(make_package, tmp_path, monkeypatch):
+    # a change to a global, or a helper method, is not in the section key: all sections are run
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    monkeypatch.chdir(tmp_path)
+    (tmp_path/'docs').mkdir()
+    src = make_package({
+        'spk/__init__.py': f'docspath = "{tmp_path}/docs"\n',
+        'spk/s.py': scaled.format(scale=1, factor=10),
+        })/'spk'
+    edits = [scaled.format(scale=2, factor=10), scaled.format(scale=2, factor=100)]
+    pages = []
+    class Watcher(object):
+        # each change, then no more for the debounce, then Ctrl-C
+        def __init__(self): self.calls = 0
+        def poll(self, timeout):
+            self.calls += 1
+            if self.calls%2==0: return set()
+            pages.append((tmp_path/'docs'/'S'/'index.html').read_text())
+            if not edits: raise KeyboardInterrupt
+            fn = src/'s.py'
+            fn.write_text(textwrap.dedent(edits.pop(0)))
+            st = fn.stat()
+            os.utime(fn, ns=(st.st_atime_ns, st.st_mtime_ns+10**9))
+            return {str(fn)}
+        def watch_files(self, files): pass
+    monkeypatch.setattr('jupydoc.watcher.make_watcher', lambda *args: Watcher())
+    assert cli.watch('spk', delay=0)
+    assert ['Value 10' in p for p in pages]==[True, False, False]
+    assert 'Value 20' in pages[1] and 'Value 200' in pages[2]